@@ -11,8 +11,19 @@
 #define POWER_PIN -1       /*!< The sensor power pin (or -1 if not switching power) */
 #define WAKE_DELAY 0       /*!< Extra time needed for the sensor to wake (0-100ms) */
 
+// placeholders: set the actuator pins to the wiring of the node before flashing
+#define PUMP_PIN 8          /*!< Relay of the pump */
+#define FAN_PIN 5           /*!< PWM pin of the fan */
+#define LED_PIN 6           /*!< PWM pin of the LED */
+
 String input ="";
 
+// actuator command <05.1f,05.1f,03d,03d,03d>: temperature, humidity setpoints, pump (s), fan, led (PWM)
+float temperatureSetpoint = -10.0;
+float humiditySetpoint = 0.0;
+unsigned long pumpUntil = 0;
+bool pumpOn = false;
+
 int sensorPinP = A4;
 int sensorPinN = A5;
 int Vpositive = 0;
@@ -94,6 +105,61 @@ void printInfo(char i) {
   Serial.print(", ");
 }
 
+/**
+ * @brief applies an actuator command <05.1f,05.1f,03d,03d,03d> (ex. <-10.0,066.5,030,150,128>)
+ * and prints the acknowledgement
+ *
+ * @return false if the command is malformed or out of range (nothing is applied)
+ */
+bool applyActuators(String command) {
+  if (!command.startsWith("<") || !command.endsWith(">")) return false;
+  String fields[5];
+  int start = 1;
+  for (int f = 0; f < 5; f++) {
+    int end = command.indexOf(f < 4 ? ',' : '>', start);
+    if (end < 0) return false;
+    fields[f] = command.substring(start, end);
+    start = end + 1;
+  }
+  if (start != command.length()) return false;  // more than 5 fields
+
+  float temperature = fields[0].toFloat();
+  float humidity = fields[1].toFloat();
+  long pump = fields[2].toInt();
+  long fan = fields[3].toInt();
+  long led = fields[4].toInt();
+  if (temperature < -10 || temperature > 50 || humidity < 0 || humidity > 100 || pump < 0 || pump > 300 ||
+      fan < 0 || fan > 255 || led < 0 || led > 255) {
+    return false;
+  }
+
+  temperatureSetpoint = temperature;
+  humiditySetpoint = humidity;
+  if (pump > 0) {
+    pumpUntil = millis() + 1000UL * pump;
+    pumpOn = true;
+    digitalWrite(PUMP_PIN, HIGH);
+  }
+  analogWrite(FAN_PIN, fan);
+  analogWrite(LED_PIN, led);
+
+  Serial.print("ack ");
+  Serial.println(command);
+  Serial.println("___");
+  return true;
+}
+
+/**
+ * @brief turns the pump off once its activation time has passed; called from every wait loop,
+ * so a sensing scan (seconds per sensor) never keeps the pump running past the commanded time
+ */
+void servicePump() {
+  if (pumpOn && (long)(millis() - pumpUntil) >= 0) {
+    pumpOn = false;
+    digitalWrite(PUMP_PIN, LOW);
+  }
+}
+
 bool getResults(char i, int resultsExpected) {
   uint8_t resultsReceived = 0;
   uint8_t cmd_number      = 0;
@@ -108,12 +174,13 @@ bool getResults(char i, int resultsExpected) {
     mySDI12.sendCommand(command, WAKE_DELAY);
 
     uint32_t start = millis();
-    while (mySDI12.available() < 3 && (millis() - start) < 1500) {}
+    while (mySDI12.available() < 3 && (millis() - start) < 1500) { servicePump(); }
     mySDI12.read();           // ignore the repeated SDI12 address
     char c = mySDI12.peek();  // check if there's a '+' and toss if so
     if (c == '+') { mySDI12.read(); }
 
     while (mySDI12.available()) {
+      servicePump();
       char c = mySDI12.peek();
       if (c == '-' || (c >= '0' && c <= '9') || c == '.') {
         float result = mySDI12.parseFloat(SKIP_NONE);
@@ -169,6 +236,7 @@ bool takeMeasurement(char i, String meas_type = "") {
 
   unsigned long timerStart = millis();
   while ((millis() - timerStart) < (1000UL * (wait + 1))) {
+    servicePump();
     if (mySDI12.available())  // sensor can interrupt us to let us know it is done early
     {
       Serial.print(millis() - timerStart);
@@ -211,6 +279,11 @@ void setup() {
   while (!Serial)
     ;
 
+  pinMode(PUMP_PIN, OUTPUT);
+  digitalWrite(PUMP_PIN, LOW);
+  pinMode(FAN_PIN, OUTPUT);
+  pinMode(LED_PIN, OUTPUT);
+
   Serial.println("Opening SDI-12 bus...");
   mySDI12.begin();
   delay(500);  // allow things to settle
@@ -258,6 +331,7 @@ void setup() {
 }
 
 void loop() {
+  servicePump();
   if(Serial && Serial.available()) {
     input = Serial.readStringUntil('\n');
     if (input == "sensing") {
@@ -280,6 +354,9 @@ void loop() {
     else if (input == "control") {
       // nothing, later pump maybe?
     }
+    else if (input.startsWith("<")) {
+      if (!applyActuators(input)) { Serial.println("wrong. retry."); }
+    }
     else {
       Serial.println("wrong. retry.");
     }
@@ -0,0 +1,119 @@
+"""
+Actuator command of the Arduino: <05.1f,05.1f,03d,03d,03d> (eg. <-10.0,066.5,255,150,128>)
+
+The command always carries every actuator (const.ACTUATORS) in order. Setpoints are held by the Arduino
+until the next command; momentary actuators (the pump) act once per command and are 0 otherwise.
+"""
+import math
+from typing import Dict, Sequence, Tuple
+
+from const import ACTUATORS, INIT_CHAR, TERMINATE_CHAR
+
+Actuator = Tuple[str, str, float, float, bool]  # name, format, minimum, maximum, momentary
+
+
+def validate(changes: dict, actuators: Sequence[Actuator] = ACTUATORS) -> Dict[str, float]:
+    """
+    Check the names, types and ranges of actuator values
+
+    Args:
+        changes: {name: value} for some of the actuators
+
+    Returns:
+        {name: int or float}
+
+    Raises:
+        ValueError: unknown actuator, wrong type or out of range
+    """
+
+    known = {actuator[0]: actuator for actuator in actuators}
+    values = {}
+    for name, value in changes.items():
+        if name not in known:
+            raise ValueError(f"Unknown actuator {name}")
+        _, fmt, minimum, maximum, _ = known[name]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"{name} must be a number, not {value!r}")
+        if fmt.endswith("d"):
+            if value != int(value):
+                raise ValueError(f"{name} must be an integer, not {value!r}")
+            value = int(value)
+        else:
+            value = round(float(value), 1)
+        if not minimum <= value <= maximum:
+            raise ValueError(f"{name} must be in [{minimum}, {maximum}], not {value}")
+        values[name] = value
+    return values
+
+
+def merge(pending: dict, changes: dict, actuators: Sequence[Actuator] = ACTUATORS) -> dict:
+    """
+    Coalesce two changes not sent yet: later setpoints supersede earlier ones,
+    and a momentary actuator keeps an earlier activation unless a later one replaces it
+    """
+
+    momentary = {actuator[0] for actuator in actuators if actuator[4]}
+    merged = dict(pending)
+    for name, value in changes.items():
+        if name in momentary and not value and merged.get(name):
+            continue
+        merged[name] = value
+    return merged
+
+
+def initial_state(actuators: Sequence[Actuator] = ACTUATORS) -> dict:
+    """
+    Values before the first command: minimum setpoints, momentary actuators off
+    """
+
+    return {name: 0 if momentary else minimum for name, _, minimum, _, momentary in actuators}
+
+
+def apply(state: dict, changes: dict, actuators: Sequence[Actuator] = ACTUATORS) -> Tuple[dict, bool]:
+    """
+    Values of the next command
+
+    Returns:
+        (values, needed): needed is False when the command would not change anything (duplicate setpoints)
+    """
+
+    values = {}
+    needed = False
+    for name, _, _, _, momentary in actuators:
+        if momentary:
+            values[name] = changes.get(name, 0)
+            needed = needed or bool(values[name])
+        else:
+            values[name] = changes.get(name, state[name])
+            needed = needed or values[name] != state[name]
+    return values, needed
+
+
+def format_command(values: dict, actuators: Sequence[Actuator] = ACTUATORS) -> str:
+    """
+    {name: value} of every actuator -> "<-10.0,066.5,255,150,128>"
+    """
+
+    fields = [format(values[name], fmt) for name, fmt, _, _, _ in actuators]
+    return INIT_CHAR + ",".join(fields) + TERMINATE_CHAR
+
+
+def parse_command(command: str, actuators: Sequence[Actuator] = ACTUATORS) -> dict:
+    """
+    "<-10.0,066.5,255,150,128>" -> {name: value}
+
+    Raises:
+        ValueError: not a valid actuator command
+    """
+
+    if not (command.startswith(INIT_CHAR) and command.endswith(TERMINATE_CHAR)):
+        raise ValueError(f"{command} is not enclosed in {INIT_CHAR}{TERMINATE_CHAR}")
+    fields = command[len(INIT_CHAR):-len(TERMINATE_CHAR)].split(",")
+    if len(fields) != len(actuators):
+        raise ValueError(f"{command} has {len(fields)} fields, not {len(actuators)}")
+    values = {}
+    for field, (name, fmt, _, _, _) in zip(fields, actuators):
+        if len(field) != int(fmt.split(".")[0].rstrip("d")):  # fixed width, zero padded
+            raise ValueError(f"{name} field {field!r} is not formatted as {fmt}")
+        values[name] = int(field) if fmt.endswith("d") else float(field)
+    return validate(values, actuators)
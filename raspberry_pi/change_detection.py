@@ -0,0 +1,80 @@
+import collections
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class ChangeDetector:
+    """
+    Detect frames that are nearly identical to a frame the client already has.
+    Thumbnails of recently transmitted frames are kept by frame id (capture timestamp),
+    so every client can be compared against the frame it holds.
+
+    Difference metrics on thumbnails (every step-th pixel):
+        color: mean absolute difference / 255
+        depth: mean absolute difference (depth units, 1 mm on D400) over pixels valid in both frames
+
+    Args:
+        color_threshold: frames with a smaller color difference ...
+        depth_threshold: ... and a smaller depth difference are unchanged
+        step: stride of the thumbnails
+        history: the number of transmitted frames remembered
+    """
+
+    def __init__(self, color_threshold: float = 0.02, depth_threshold: float = 10, step: int = 8, history: int = 32):
+        self.color_threshold = color_threshold
+        self.depth_threshold = depth_threshold
+        self.step = step
+        self.thumbnails = collections.OrderedDict()
+        self.history = history
+        self._lock = threading.Lock()
+
+    def thumbnail(self, rgbd_image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        thumb = rgbd_image[::self.step, ::self.step]
+        return thumb[..., :3].astype(np.int16), thumb[..., 3].astype(np.int32)
+
+    def difference(self, a: Tuple[np.ndarray, np.ndarray], b: Tuple[np.ndarray, np.ndarray]) -> Tuple[float, float]:
+        """
+        Returns:
+            color difference, depth difference of two thumbnails
+        """
+
+        if a[0].shape != b[0].shape:
+            return float("inf"), float("inf")
+        color_diff = float(np.abs(a[0] - b[0]).mean()) / 255
+        valid = (a[1] > 0) & (b[1] > 0)
+        depth_diff = float(np.abs(a[1] - b[1])[valid].mean()) if valid.any() else 0.0
+        return color_diff, depth_diff
+
+    def remember(self, frame_id: float, rgbd_image: np.ndarray):
+        """
+        Keep the thumbnail of a transmitted frame
+        """
+
+        with self._lock:
+            self.thumbnails[frame_id] = self.thumbnail(rgbd_image)
+            self.thumbnails.move_to_end(frame_id)
+            while len(self.thumbnails) > self.history:
+                self.thumbnails.popitem(last=False)
+
+    def compare(self, since: Optional[float], rgbd_image: np.ndarray) -> Optional[dict]:
+        """
+        Compare a frame with the frame the client holds
+
+        Args:
+            since: frame id held by the client (None: the client has no frame)
+            rgbd_image: current frame
+
+        Returns:
+            {"color_diff": float, "depth_diff": float} if the frame is unchanged, None otherwise
+        """
+
+        with self._lock:
+            reference = self.thumbnails.get(since) if since is not None else None
+        if reference is None:
+            return None
+        color_diff, depth_diff = self.difference(self.thumbnail(rgbd_image), reference)
+        if color_diff < self.color_threshold and depth_diff < self.depth_threshold:
+            return {"color_diff": color_diff, "depth_diff": depth_diff}
+        return None
@@ -0,0 +1,89 @@
+"""
+Site configuration of rasp_server: a JSON file overriding the defaults of const.py, so a node is set up
+without editing the code. Every key is optional; capture_profiles and preprocessing are merged by name.
+
+Example (rasp_config.json):
+    {
+        "host": "192.168.10.21",
+        "port": 9999,
+        "usb": "/dev/ttyACM0",
+        "approved_ip": ["192.168.10.2"],
+        "run_dir": "/home/pi/runs",
+        "store_dir": "/home/pi/store",
+        "archive_dir": "/mnt/ssd/archive",
+        "save_images": false,
+        "capture_profiles": {"standard": {"depth": [848, 480, 15], "color": [848, 480, 15]}},
+        "schedule_interval": 600
+    }
+"""
+import copy
+import json
+import os
+from typing import Optional
+
+from const import (
+    APPROVED_IP,
+    STORE_DIR,
+    ARCHIVE_DIR,
+    SAVE_IMAGES,
+    PREPROCESSING,
+    CAPTURE_PROFILES,
+    DEFAULT_PROFILE,
+    CHANGE_DETECTION,
+    SCHEDULE_INTERVAL,
+    SCHEDULE_PROFILE,
+)
+
+DEFAULTS = {
+    "host": "0.0.0.0",  # bind address (all interfaces); no lookup of the outside world
+    "port": 9999,
+    "usb": "/dev/ttyACM0",  # serial port of the Arduino
+    "baudrate": 115200,  # Serial.begin() of main.ino
+    "approved_ip": APPROVED_IP,
+    "run_dir": ".",  # Server_<date> directories (log.txt, img/ if save_images) of every run
+    "store_dir": STORE_DIR,
+    "archive_dir": ARCHIVE_DIR,
+    "save_images": SAVE_IMAGES,
+    "preprocessing": PREPROCESSING,
+    "capture_profiles": CAPTURE_PROFILES,
+    "default_profile": DEFAULT_PROFILE,
+    "change_detection": CHANGE_DETECTION,
+    "schedule_interval": SCHEDULE_INTERVAL,
+    "schedule_profile": SCHEDULE_PROFILE,
+}
+MERGED = ("preprocessing", "capture_profiles")  # dicts updated key by key instead of replaced
+
+
+def load_config(path: Optional[str] = None) -> dict:
+    """
+    Defaults updated with the configuration file
+
+    Args:
+        path: JSON file (None or a missing file: defaults)
+
+    Returns:
+        configuration with every key of DEFAULTS
+
+    Raises:
+        ValueError: unknown key or profile
+    """
+
+    config = copy.deepcopy(DEFAULTS)
+    if path is None or not os.path.exists(path):
+        return config
+    with open(path) as f:
+        overrides = json.load(f)
+
+    unknown = set(overrides) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown keys in {path}: {', '.join(sorted(unknown))}")
+    for key, value in overrides.items():
+        if key in MERGED and value is not None:
+            config[key].update(value)
+        else:
+            config[key] = value
+
+    for key in ("default_profile", "schedule_profile"):
+        if config[key] not in config["capture_profiles"]:
+            raise ValueError(f"{key} {config[key]} is not in capture_profiles of {path}")
+    return config
@@ -1,7 +1,72 @@
+CONFIG_FILE = "rasp_config.json"  # site configuration overriding the defaults below (see config.py)
 APPROVED_IP = [ # approved ip for communications with rasp
     "*"
 ]
 CMD_SENSING = "sensing"
 CMD_CONTROL = "control"
+CMD_REQUEST = "request"  # followed by a wire.py message; every command is 7 characters
+CMD_SESSION = "session"  # followed by wire.py messages until {"cmd": "close"}
+CMD_PING = "ping"  # heartbeat inside a session
+CMD_SAMPLES = "samples"  # scheduled samples since a cursor
+CMD_SYNC = "sync"  # stream of every stored record since cursors
+CMD_METRICS = "metrics"  # counters and latency histograms (metrics.py)
+CMD_STATUS = "status"  # health of the serial link, camera and workers
+SESSION_IDLE_TIMEOUT = 120  # seconds; clients send heartbeats more often than this
+SERIAL_WAIT = 10  # seconds a command waits for the Arduino while the serial link is reopened
+RESTART_BACKOFF = (1, 60)  # first and maximum seconds between attempts to reopen the serial link or the socket
 INIT_CHAR = '<'
-TERMINATE_CHAR = '>'
\ No newline at end of file
+TERMINATE_CHAR = '>'
+ACTUATORS = [  # fields of the actuator command <05.1f,05.1f,03d,03d,03d> in order (see actuation.py)
+    # (name, format, minimum, maximum, momentary)
+    ("temperature", "05.1f", -10.0, 50.0, False),  # setpoint (degC)
+    ("humidity", "05.1f", 0.0, 100.0, False),  # setpoint (%)
+    ("pump", "03d", 0, 300, True),  # activation time (s), once per command
+    ("fan", "03d", 0, 255, False),  # PWM duty
+    ("led", "03d", 0, 255, False),  # PWM duty
+]
+STORE_DIR = "store"  # RecordStore of observations and actions, shared by every run
+ARCHIVE_DIR = "archive"  # FrameArchive of captured frames, shared by every run
+SAVE_IMAGES = False  # jpg/png files of every frame in <run>/img besides the archive (twice the writes)
+PREPROCESSING = {  # options of get_rgbd_img.Preprocessor
+    "align": True,
+    "decimation": 0,
+    "spatial": True,
+    "temporal": True,
+    "hole_filling": False,
+    "roi": None,  # (x, y, w, h) of the plant bed, in pixels of the color stream (override it per profile)
+    "downsample": 1,
+}
+CAPTURE_PROFILES = {  # streams of get_rgbd_img.RGBDCapture, requested per call with {"profile": name}
+    # "depth"/"color": (width, height, fps); "<product line>": overrides for that device;
+    # "product_lines": devices supporting the profile; "preprocessing": overrides of PREPROCESSING
+    "preview": {  # frequent monitoring: ~1/4 of the pixels and CPU of "standard"
+        "depth": (424, 240, 6),
+        "color": (424, 240, 6),
+        "preprocessing": {"spatial": False},
+        "L500": {"depth": (320, 240, 30), "color": (960, 540, 6)},
+    },
+    "standard": {
+        "depth": (640, 480, 15),
+        "color": (640, 480, 15),
+        "L500": {"color": (960, 540, 15)},
+    },
+    "full": {  # daily phenotyping
+        "depth": (1280, 720, 6),
+        "color": (1280, 720, 6),
+        "product_lines": ["D400"],
+    },
+    "l515": {
+        "depth": (1024, 768, 30),
+        "color": (1280, 720, 15),
+        "product_lines": ["L500"],
+    },
+}
+DEFAULT_PROFILE = "standard"  # requests without a profile and the legacy protocol
+LEGACY_SHAPE = (480, 640)  # (H, W) old clients expect from the legacy protocol, whatever the camera (fit_rgbd)
+CHANGE_DETECTION = {  # options of change_detection.ChangeDetector (None: always send frames)
+    "color_threshold": 0.02,
+    "depth_threshold": 10,
+}
+SCHEDULE_INTERVAL = 300  # seconds between scheduled samples (0: only on request)
+SCHEDULE_PROFILE = DEFAULT_PROFILE  # capture profile of scheduled samples
+SAMPLE_WRITE_TIMEOUT = 30  # seconds a scheduled sample waits for room in the frame writer backlog
@@ -0,0 +1,167 @@
+import os
+import threading
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+INDEX_DTYPE = np.dtype("<f8")  # capture timestamp (time.time()) per frame
+
+
+class FrameArchive:
+    """
+    Memory-mapped archive of fixed-shape rgbd frames for dataset loading.
+
+    Layout (root/<H>x<W>/):
+        index.f8          - capture timestamps, float64, one per frame, increasing
+        <segment>.color   - uint8 (segment_frames, H, W, 3) BGR
+        <segment>.depth   - uint16 (segment_frames, H, W)
+    Frame i is stored at row i % segment_frames of segment i // segment_frames.
+    Frame data is flushed before its timestamp is appended, so the index only lists complete frames
+    and readers in other processes can open the archive while it is written.
+
+    Args:
+        root: directory of the archive
+        shape: (H, W) of the frames
+        segment_frames: frames per segment file
+    """
+
+    def __init__(self, root: str, shape: Tuple[int, int] = (480, 640), segment_frames: int = 256):
+        self.shape = tuple(shape)
+        self.segment_frames = segment_frames
+        self.path = os.path.join(root, "%dx%d" % self.shape)
+        self.index_path = os.path.join(self.path, "index.f8")
+        self._segments = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def __len__(self) -> int:
+        if not os.path.exists(self.index_path):
+            return 0
+        return os.path.getsize(self.index_path) // INDEX_DTYPE.itemsize
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """
+        Capture timestamps of every frame (memory-mapped, read only)
+        """
+
+        count = len(self)
+        if count == 0:
+            return np.empty(0, dtype=INDEX_DTYPE)
+        return np.memmap(self.index_path, dtype=INDEX_DTYPE, mode="r", shape=(count,))
+
+    @property
+    def last_timestamp(self) -> Optional[float]:
+        """
+        Capture timestamp of the last frame, None if the archive is empty
+        """
+
+        timestamps = self.timestamps
+        return float(timestamps[-1]) if len(timestamps) else None
+
+    def _segment(self, segment: int, mode: str) -> Tuple[np.memmap, np.memmap]:
+        key = (segment, mode)
+        if key not in self._segments:
+            h, w = self.shape
+            base = os.path.join(self.path, "%06d" % segment)
+            if mode == "r+" and not os.path.exists(base + ".color"):
+                mode = "w+"
+            color = np.memmap(base + ".color", dtype=np.uint8, mode=mode, shape=(self.segment_frames, h, w, 3))
+            depth = np.memmap(base + ".depth", dtype=np.uint16, mode=mode, shape=(self.segment_frames, h, w))
+            self._segments[key] = (color, depth)
+        return self._segments[key]
+
+    def append(self, timestamp: float, color: np.ndarray, depth: np.ndarray) -> int:
+        """
+        Append a frame
+
+        Args:
+            timestamp: capture time, greater than the last one
+            color: (H, W, 3) BGR
+            depth: (H, W) or (H, W, 1)
+
+        Returns:
+            index of the frame
+        """
+
+        with self._lock:
+            index = len(self)
+            if index and timestamp <= self.last_timestamp:
+                raise ValueError(f"timestamp {timestamp} is not after the last frame")
+            segment, row = divmod(index, self.segment_frames)
+            seg_color, seg_depth = self._segment(segment, "r+")
+            seg_color[row] = color
+            seg_depth[row] = depth.reshape(self.shape)
+            seg_color.flush()
+            seg_depth.flush()
+            with open(self.index_path, "ab") as f:
+                f.write(np.array([timestamp], dtype=INDEX_DTYPE).tobytes())
+            if row == self.segment_frames - 1:  # segment full
+                del self._segments[(segment, "r+")]
+        return index
+
+    def chunks(self, start: int = 0, stop: int = None) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Frames [start, stop) as zero-copy views, one chunk per segment
+
+        Yields:
+            timestamps (n,), color (n, H, W, 3) uint8, depth (n, H, W) uint16
+        """
+
+        count = len(self)
+        stop = count if stop is None else min(stop, count)
+        timestamps = self.timestamps
+        while start < stop:
+            segment, row = divmod(start, self.segment_frames)
+            n = min(stop - start, self.segment_frames - row)
+            color, depth = self._segment(segment, "r")
+            yield timestamps[start:start + n], color[row:row + n], depth[row:row + n]
+            start += n
+
+    def frames(self, start: int = 0, stop: int = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Frames [start, stop); views when the range is inside one segment, otherwise concatenated
+
+        Returns:
+            timestamps (n,), color (n, H, W, 3) uint8, depth (n, H, W) uint16
+        """
+
+        chunks = list(self.chunks(start, stop))
+        if not chunks:
+            h, w = self.shape
+            return (
+                np.empty(0, dtype=INDEX_DTYPE),
+                np.empty((0, h, w, 3), dtype=np.uint8),
+                np.empty((0, h, w), dtype=np.uint16),
+            )
+        if len(chunks) == 1:
+            return chunks[0]
+        return tuple(np.concatenate(arrays) for arrays in zip(*chunks))
+
+    def find(self, start: float = None, end: float = None) -> Tuple[int, int]:
+        """
+        Index range [first, last) of frames captured in [start, end)
+        """
+
+        timestamps = self.timestamps
+        first = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+        last = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side="left"))
+        return first, last
+
+    def lookup(self, timestamp: float) -> Optional[int]:
+        """
+        Index of the frame captured at timestamp (None if not archived)
+        """
+
+        timestamps = self.timestamps
+        index = int(np.searchsorted(timestamps, timestamp, side="left"))
+        if index < len(timestamps) and timestamps[index] == timestamp:
+            return index
+        return None
+
+    def between(self, start: float = None, end: float = None) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Zero-copy chunks of the frames captured in [start, end) (time.time())
+        """
+
+        return self.chunks(*self.find(start, end))
@@ -0,0 +1,135 @@
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+from frame_archive import FrameArchive
+from get_rgbd_img import save_rgbd_img
+from metrics import registry
+
+
+class FrameWriter:
+    """
+    Background writer of captured rgbd images, so requests do not wait for the disk.
+    The archive is the store of the frames; jpg/png image files are optional (written besides, not instead).
+    Each frame (identified by its capture timestamp) is written once, even when several requests send it:
+    frames not after the last one of the archive are skipped.
+    When max_backlog frames are waiting, new frames are dropped and counted instead of blocking the caller,
+    unless the caller waits for room (submit timeout, ex. scheduled samples).
+
+    Args:
+        path_to_save: directory of the jpg/png images (None: no image files, ex. config["save_images"] false)
+        max_backlog: the maximum number of frames waiting to be written
+        archive_root: directory of the FrameArchive (None: no archive); one archive per frame shape
+    """
+
+    def __init__(self, path_to_save: str, max_backlog: int = 8, archive_root: str = None):
+        self.path_to_save = path_to_save
+        self.archive_root = archive_root
+        self.archives = {}
+        self.queue = queue.Queue(maxsize=max_backlog)
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.max_backlog_seen = 0
+        self.write_seconds = 0.0
+        self._last_timestamp = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.logger = logging.getLogger("Server")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="FrameWriter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Write the frames already queued, then stop
+        """
+
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, timestamp: float, rgbd_image: np.ndarray, timeout: float = 0.0) -> bool:
+        """
+        Queue a frame for writing
+
+        Args:
+            timeout: seconds to wait for room in the backlog (0: drop the frame at once if it is full)
+
+        Returns:
+            True if queued (or already written), False if dropped because the backlog is full
+        """
+
+        with self._lock:
+            if timestamp == self._last_timestamp:
+                return True
+        try:
+            # outside the lock: a waiting sample does not hold up the frames of requests
+            self.queue.put((timestamp, rgbd_image), block=timeout > 0, timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            registry.count("frames_dropped")
+            self.logger.warning(f"Frame writer backlog full, dropped frame ({self.dropped} dropped)")
+            return False
+        with self._lock:
+            self._last_timestamp = timestamp
+            self.submitted += 1
+            self.max_backlog_seen = max(self.max_backlog_seen, self.queue.qsize())
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "backlog": self.queue.qsize(),
+            "max_backlog": self.queue.maxsize,
+            "max_backlog_seen": self.max_backlog_seen,
+            "write_seconds": self.write_seconds,
+        }
+
+    def _archive(self, shape) -> FrameArchive:
+        if shape not in self.archives:
+            self.archives[shape] = FrameArchive(self.archive_root, shape)
+        return self.archives[shape]
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            timestamp, rgbd_image = job
+            start = time.time()
+            try:
+                if self.archive_root is not None:
+                    archive = self._archive(rgbd_image.shape[:2])
+                    last = archive.last_timestamp
+                    if last is not None and timestamp <= last:
+                        if archive.lookup(timestamp) is not None:
+                            self.duplicates += 1  # queued again meanwhile
+                        else:
+                            self.dropped += 1
+                            registry.count("frames_dropped")
+                            self.logger.warning(f"Frame writer dropped frame {timestamp}, older than the archive")
+                        continue
+                    archive.append(timestamp, rgbd_image[..., :3], rgbd_image[..., 3])
+                if self.path_to_save is not None:
+                    save_rgbd_img(rgbd_image, self.path_to_save, timestamp)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                self.logger.error(f"Frame writer error - {e.__str__()}")
+            self.write_seconds += time.time() - start
+            registry.observe("persist", time.time() - start)
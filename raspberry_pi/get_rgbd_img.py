@@ -1,12 +1,66 @@
+import collections
+import logging
 import os
+import threading
 import time
+from typing import Dict, Optional, Tuple
+
 import numpy as np
-import cv2
-import pyrealsense2.pyrealsense2 as rs
 
-def get_rgbd_img(path_to_save=None):
-    pipeline = rs.pipeline()
-    config = rs.config()
+from metrics import registry
+from utils import LazyModule
+
+# imported on first use, in the capture thread: seconds on a Raspberry Pi, so not on the start-up path
+cv2 = LazyModule("cv2")
+rs = LazyModule("pyrealsense2.pyrealsense2")
+
+# streams when no capture profile is given (see const.CAPTURE_PROFILES for the format)
+DEFAULT_STREAMS = {
+    "depth": (640, 480, 15),
+    "color": (640, 480, 15),
+    "L500": {"color": (960, 540, 15)},
+}
+
+
+def resolve_profile(profile: dict, product_line: str) -> dict:
+    """
+    Streams of a capture profile for one device
+
+    Args:
+        profile: ex. const.CAPTURE_PROFILES["preview"]
+        product_line: ex. 'D400', 'L500'
+
+    Returns:
+        {"depth": (width, height, fps), "color": (width, height, fps), "preprocessing": dict}
+
+    Raises:
+        ValueError: the profile is not supported by the device
+    """
+
+    if product_line not in profile.get("product_lines", [product_line]):
+        raise ValueError(f"Capture profile is not supported by {product_line}")
+    streams = {"preprocessing": {}}
+    streams.update({key: value for key, value in profile.items() if key in ("depth", "color", "preprocessing")})
+    streams.update(profile.get(product_line, {}))
+    return streams
+
+
+def configure_streams(pipeline, config, profile: dict = None) -> str:
+    """
+    Resolve the connected device and enable the depth and color streams on config
+
+    Args:
+        pipeline: rs.pipeline
+        config: rs.config
+        profile: capture profile (default: DEFAULT_STREAMS)
+
+    Returns:
+        device product line (ex. 'D400', 'L500')
+
+    Raises:
+        RuntimeError: Depth camera with Color sensor are not installed correctly
+        ValueError: the profile is not supported by the device
+    """
 
     # Get device product line for setting a supporting resolution
     pipeline_wrapper = rs.pipeline_wrapper(pipeline)
@@ -20,24 +74,32 @@ def get_rgbd_img(path_to_save=None):
             found_rgb = True
             break
     if not found_rgb:
-        print("Depth camera with Color sensor are not installed correctly")
-        exit(0)
+        raise RuntimeError("Depth camera with Color sensor are not installed correctly")
 
-    config.enable_stream(rs.stream.depth, 640, 480, rs.format.z16, 15)
+    streams = resolve_profile(profile or DEFAULT_STREAMS, device_product_line)
+    width, height, fps = streams["depth"]
+    config.enable_stream(rs.stream.depth, width, height, rs.format.z16, fps)
+    width, height, fps = streams["color"]
+    config.enable_stream(rs.stream.color, width, height, rs.format.bgr8, fps)
+    return device_product_line
 
-    if device_product_line == 'L500':
-        config.enable_stream(rs.stream.color, 960, 540, rs.format.bgr8, 15)
-    else:
-        config.enable_stream(rs.stream.color, 640, 480, rs.format.bgr8, 15)
 
-    # Start streaming
-    pipeline.start(config)
+def frames_to_rgbd(frames) -> np.ndarray:
+    """
+    Convert a coherent pair of depth and color frames to one rgbd image
+
+    Args:
+        frames: rs.composite_frame from pipeline.wait_for_frames()
+
+    Returns:
+        rgbd_image: (H, W, 4) - BGR + depth
+    """
 
-    # Wait for a coherent pair of frames: depth and color
-    frames = pipeline.wait_for_frames()
     depth_frame = frames.get_depth_frame()
     color_frame = frames.get_color_frame()
-    
+    if not depth_frame or not color_frame:
+        raise RuntimeError("Incomplete frameset from the camera")
+
     # Convert images to numpy arrays
     depth_image = np.asanyarray(depth_frame.get_data())
     color_image = np.asanyarray(color_frame.get_data())
@@ -51,20 +113,355 @@ def get_rgbd_img(path_to_save=None):
 
     # If depth and color resolutions are different, resize color image to match depth image for display
     if depth_colormap_dim != color_colormap_dim:
-        print(f"Resize color image to match depth image: {color_colormap_dim} -> {depth_colormap_dim}")
         color_image = cv2.resize(color_image, dsize=(depth_colormap_dim[1], depth_colormap_dim[0]), interpolation=cv2.INTER_AREA)
-    rgbd_image = np.concatenate((color_image, depth_image), axis = -1)
+    return np.concatenate((color_image, depth_image), axis = -1)
+
+
+class Preprocessor:
+    """
+    Preprocessing of rgbd images on the Raspberry Pi
+
+    RealSense stage (on framesets, see process_frames), in the order recommended by Intel:
+        decimation -> depth to disparity -> spatial -> temporal -> disparity to depth -> hole filling -> align
+    NumPy stage (on rgbd images, see process_image):
+        roi crop -> downsample (color: area average, depth: nearest, so no invalid depth is mixed in)
+
+    Args:
+        align: align depth to the color stream (registered depth)
+        decimation: decimation filter magnitude (0: off)
+        spatial: spatial edge-preserving filter
+        temporal: temporal filter (needs consecutive frames; use with RGBDCapture)
+        hole_filling: hole filling filter
+        roi: (x, y, w, h) in pixels of the aligned image, ex. the plant bed (None: whole image)
+        downsample: integer factor applied after roi (1: off)
+    """
+
+    def __init__(
+        self,
+        align: bool = True,
+        decimation: int = 0,
+        spatial: bool = False,
+        temporal: bool = False,
+        hole_filling: bool = False,
+        roi: Tuple[int, int, int, int] = None,
+        downsample: int = 1,
+    ):
+        self.roi = roi
+        self.downsample = downsample
+        self.filters = []
+        if decimation:
+            decimation_filter = rs.decimation_filter()
+            decimation_filter.set_option(rs.option.filter_magnitude, decimation)
+            self.filters.append(decimation_filter)
+        if spatial or temporal:
+            self.filters.append(rs.disparity_transform(True))
+            if spatial:
+                self.filters.append(rs.spatial_filter())
+            if temporal:
+                self.filters.append(rs.temporal_filter())
+            self.filters.append(rs.disparity_transform(False))
+        if hole_filling:
+            self.filters.append(rs.hole_filling_filter())
+        self.align = rs.align(rs.stream.color) if align else None
+
+    def process_frames(self, frames):
+        for f in self.filters:
+            frames = f.process(frames).as_frameset()
+        if self.align is not None:
+            frames = self.align.process(frames)
+        return frames
+
+    def process_image(self, rgbd_image: np.ndarray) -> np.ndarray:
+        if self.roi is not None:
+            x, y, w, h = self.roi
+            rgbd_image = rgbd_image[y:y + h, x:x + w]
+        if self.downsample > 1:
+            step = self.downsample
+            depth_image = rgbd_image[step // 2::step, step // 2::step, 3:]
+            h, w = depth_image.shape[:2]
+            color_image = cv2.resize(
+                np.ascontiguousarray(rgbd_image[..., :3], dtype=np.uint8), dsize=(w, h), interpolation=cv2.INTER_AREA
+            )
+            rgbd_image = np.concatenate((color_image, depth_image), axis=-1)
+        return np.ascontiguousarray(rgbd_image)
+
+    def __call__(self, frames) -> np.ndarray:
+        """
+        frameset from pipeline.wait_for_frames() -> preprocessed rgbd image
+        """
+        return self.process_image(frames_to_rgbd(self.process_frames(frames)))
+
+
+def fit_rgbd(rgbd_image: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    """
+    Center crop to the aspect ratio of shape, then resize (color: area, depth: nearest, no mixed depths)
+
+    Args:
+        rgbd_image: (H, W, 4) - BGR + depth
+        shape: (height, width) of the result, ex. (480, 640)
+
+    Returns:
+        (height, width, 4) uint16; rgbd_image itself if it already has the shape
+    """
+
+    height, width = shape
+    h, w = rgbd_image.shape[:2]
+    if (h, w) == (height, width):
+        return rgbd_image.astype(np.uint16, copy=False)
+    if h * width > w * height:  # too tall
+        crop = w * height // width
+        rgbd_image = rgbd_image[(h - crop) // 2:(h - crop) // 2 + crop]
+    elif h * width < w * height:  # too wide (ex. 960 x 540 of L500)
+        crop = h * width // height
+        rgbd_image = rgbd_image[:, (w - crop) // 2:(w - crop) // 2 + crop]
+    color_image = cv2.resize(
+        np.ascontiguousarray(rgbd_image[..., :3]), dsize=(width, height), interpolation=cv2.INTER_AREA
+    )
+    depth_image = cv2.resize(
+        np.ascontiguousarray(rgbd_image[..., 3]), dsize=(width, height), interpolation=cv2.INTER_NEAREST
+    )
+    return np.concatenate((color_image.astype(np.uint16), depth_image[..., None].astype(np.uint16)), axis=-1)
+
+
+def save_rgbd_img(rgbd_image: np.ndarray, path_to_save: str = "auto", timestamp: float = None):
+    """
+    Save color as jpg and depth as 16-bit png (lossless)
+
+    Args:
+        rgbd_image: (H, W, 4) - BGR + depth
+        path_to_save: directory to save; "auto" -> "img"
+        timestamp: capture time used for the file names (default: now)
+    """
+
+    if timestamp is None:
+        timestamp = time.time()
+    name = time.strftime("%Y_%m_%d_%H_%M_%S", time.localtime(timestamp)) + "_%03d" % (timestamp % 1 * 1000)
+    if path_to_save == "auto":
+        path_to_save = "img"
+    os.makedirs(path_to_save, exist_ok=True)
+    cv2.imwrite(os.path.join(path_to_save, f"{name}_color.jpg"), rgbd_image[..., :3].astype(np.uint8))
+    cv2.imwrite(os.path.join(path_to_save, f"{name}_depth.png"), rgbd_image[..., 3].astype(np.uint16))
+
+
+def get_rgbd_img(path_to_save=None, profile: dict = None):
+    """
+    Start the camera, grab a single rgbd image and stop again.
+    Use RGBDCapture for repeated captures.
+    """
+
+    pipeline = rs.pipeline()
+    config = rs.config()
+    try:
+        configure_streams(pipeline, config, profile)
+    except RuntimeError as e:
+        print(e)
+        exit(0)
+
+    # Start streaming
+    pipeline.start(config)
+
+    # Wait for a coherent pair of frames: depth and color
+    frames = pipeline.wait_for_frames()
+    rgbd_image = frames_to_rgbd(frames)
 
     if path_to_save is not None:
-        filename4rgb = f'{time.strftime("%Y_%m_%d_%H_%M_%S")}_color.jpg'
-        filename4depth = f'{time.strftime("%Y_%m_%d_%H_%M_%S")}_depth.jpg'
-        if path_to_save == "auto":
-            path_to_save = "img"
-        os.makedirs(path_to_save, exist_ok=True)
-        cv2.imwrite(os.path.join(path_to_save, filename4rgb), rgbd_image[..., :3])
-        cv2.imwrite(os.path.join(path_to_save, filename4depth), rgbd_image[..., 3:])
+        save_rgbd_img(rgbd_image, path_to_save)
 
     # Stop streaming
     pipeline.stop()
 
-    return rgbd_image
\ No newline at end of file
+    return rgbd_image
+
+
+class RGBDCapture:
+    """
+    Long-lived capture service.
+    The pipeline is started once and a background thread keeps the latest rgbd images in a ring buffer.
+    When the device drops, the pipeline is restarted after reconnect_delay.
+
+    The streams follow the capture profile of the requests (latest(profile=...)): the pipeline is restarted
+    only when a request needs another profile, and not while requests for the current one are waiting.
+
+    Args:
+        buffer_size: the number of the latest rgbd images kept in memory
+        warmup: seconds of frames dropped after (re)start while auto exposure settles
+            (time, not a frame count: 30 frames would take 5 s at the 6 fps of the preview profile)
+        reconnect_delay: seconds to wait before restarting the pipeline
+        frame_timeout: seconds to wait for a frameset before treating the device as dropped
+        preprocessing: options of Preprocessor (None: raw frames as get_rgbd_img)
+        profiles: capture profiles by name (see const.CAPTURE_PROFILES)
+        profile: initial profile (None: DEFAULT_STREAMS)
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = 4,
+        warmup: float = 1.0,
+        reconnect_delay: float = 1.0,
+        frame_timeout: float = 5.0,
+        preprocessing: dict = None,
+        profiles: Dict[str, dict] = None,
+        profile: Optional[str] = None,
+    ):
+        self.preprocessing = preprocessing
+        self.profiles = {None: DEFAULT_STREAMS, **(profiles or {})}
+        self.profile = None  # profile of the images in the buffer
+        self.switch_count = 0
+        self.switch_started = None  # time.time() a profile switch was requested, until its first image
+        self.buffer = collections.deque(maxlen=buffer_size)
+        self.warmup = warmup
+        self.reconnect_delay = reconnect_delay
+        self.frame_timeout = frame_timeout
+        self.product_line = None
+        self.preprocessor = None
+        self.reconnect_count = 0
+
+        self._wanted = profile
+        self._waiting = collections.Counter()  # profile -> latest() calls waiting for it
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.logger = logging.getLogger("Server")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="RGBDCapture", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.frame_timeout + self.reconnect_delay)
+            self._thread = None
+
+    def latest(
+        self, max_age: Optional[float] = None, timeout: float = 10.0, profile: Optional[str] = None
+    ) -> Tuple[float, np.ndarray]:
+        """
+        Get the latest rgbd image in the ring buffer
+
+        Args:
+            max_age: wait for a newer image when the latest one is older than max_age seconds
+            timeout: seconds to wait for an image (including a profile switch, a few seconds)
+            profile: capture profile of the image (None: the current one)
+
+        Returns:
+            timestamp: capture time (time.time())
+            rgbd_image: (H, W, 4) - BGR + depth
+
+        Raises:
+            TimeoutError: No image was captured in time
+            ValueError: Unknown profile or not supported by the camera
+        """
+
+        if profile is not None:
+            if profile not in self.profiles:
+                raise ValueError(f"Unknown capture profile {profile}")
+            if self.product_line is not None:
+                resolve_profile(self.profiles[profile], self.product_line)
+
+        deadline = time.time() + timeout
+        with self._cond:
+            self._waiting[profile] += 1
+            try:
+                while True:
+                    if self.buffer and (profile is None or self.profile == profile):
+                        timestamp, rgbd_image = self.buffer[-1]
+                        if max_age is None or time.time() - timestamp <= max_age:
+                            return timestamp, rgbd_image
+                    if profile is not None and self._wanted != profile and not self._waiting[self._wanted]:
+                        self.logger.info(f"Capture profile {self._wanted} -> {profile}")
+                        self._wanted = profile
+                        self.switch_started = time.time()
+                        self.buffer.clear()
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise TimeoutError("No rgbd image from the camera")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting[profile] -= 1
+                self._cond.notify_all()  # requests for another profile may switch now
+
+    def stats(self) -> dict:
+        """
+        Health of the capture: ok while images keep arriving (the latest is younger than frame_timeout).
+        A profile switch empties the buffer: "switching" and still ok, unless it takes longer than
+        2 * frame_timeout (then the camera is as good as dropped)
+        """
+
+        with self._cond:
+            timestamp = self.buffer[-1][0] if self.buffer else None
+            switch_started = self.switch_started
+        now = time.time()
+        age = now - timestamp if timestamp is not None else None
+        switching = switch_started is not None
+        return {
+            "ok": (age is not None and age < self.frame_timeout)
+            or (switching and now - switch_started < 2 * self.frame_timeout),
+            "switching": switching,
+            "product_line": self.product_line,
+            "profile": self.profile,
+            "frame_age": age,
+            "reconnects": self.reconnect_count,
+            "profile_switches": self.switch_count,
+        }
+
+    def _open(self):
+        profile = self._wanted
+        pipeline = rs.pipeline()
+        config = rs.config()
+        self.product_line = configure_streams(pipeline, config, self.profiles[profile])
+        pipeline.start(config)
+        # filters keep state (temporal filter): new ones for every (re)start
+        if self.preprocessing is not None:
+            streams = resolve_profile(self.profiles[profile], self.product_line)
+            self.preprocessor = Preprocessor(**{**self.preprocessing, **streams["preprocessing"]})
+        else:
+            self.preprocessor = None
+        warmed_up = time.time() + self.warmup
+        while time.time() < warmed_up:
+            pipeline.wait_for_frames(int(self.frame_timeout * 1000))
+        with self._cond:
+            self.profile = profile
+            self.buffer.clear()
+        self.logger.info(f"Camera ready ({self.product_line}, profile {profile})")
+        return pipeline
+
+    def _run(self):
+        pipeline = None
+        while not self._stop.is_set():
+            try:
+                if pipeline is not None and self.profile != self._wanted:
+                    pipeline.stop()
+                    pipeline = None
+                    self.switch_count += 1
+                    registry.count("profile_switches")
+                if pipeline is None:
+                    pipeline = self._open()
+                frames = pipeline.wait_for_frames(int(self.frame_timeout * 1000))
+                if self.preprocessor is not None:
+                    rgbd_image = self.preprocessor(frames)
+                else:
+                    rgbd_image = frames_to_rgbd(frames)
+                with self._cond:
+                    if self.profile == self._wanted:
+                        self.buffer.append((time.time(), rgbd_image))
+                        self.switch_started = None
+                        self._cond.notify_all()
+
+            except Exception as e:
+                self.logger.error(f"Camera error - {e.__str__()}")
+                if pipeline is not None:
+                    try:
+                        pipeline.stop()
+                    except Exception:
+                        pass
+                    pipeline = None
+                    self.reconnect_count += 1
+                    registry.count("camera_reconnects")
+                self._stop.wait(self.reconnect_delay)
+
+        if pipeline is not None:
+            pipeline.stop()
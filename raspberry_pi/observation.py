@@ -0,0 +1,101 @@
+import re
+import time
+from typing import List, NamedTuple, Optional
+
+ANALOG_ADDRESS = "A4-A5"  # differential analog input of main.ino
+ANALOG_UNIT = "W*m-2"
+MISSING_VALUE = -9999  # SDI-12 value of a failed measurement
+# getResults() prints ", " only for a '+' sign, so a negative value follows the previous one directly
+NUMBER = re.compile(r"[+-]?\d+(?:\.\d+)?")
+
+
+class Reading(NamedTuple):
+    """
+    One sensor reading of a sensing command
+
+    timestamp: time.time() when the sensing command was sent
+    address: SDI-12 address ('0'-'9', 'a'-'z', 'A'-'Z') or ANALOG_ADDRESS
+    values: measurements (None for failed measurements)
+    """
+
+    timestamp: float
+    address: str
+    values: List[Optional[float]]
+
+
+def _to_value(field: str) -> Optional[float]:
+    value = float(field)
+    return None if value == MISSING_VALUE else value
+
+
+def parse_sdi12_line(content: str, timestamp: float) -> Optional[Reading]:
+    """
+    Parse a line printed by takeMeasurement() of main.ino
+
+    Args:
+        content: "[addr]M!, [addr], [wait], [numResults], ([elapsed ms], )[value], [value]-[value], ... "
+            (", " precedes positive values only)
+        timestamp: timestamp of the reading
+
+    Returns:
+        Reading or None if content is not a measurement line
+    """
+
+    fields = [field.strip() for field in content.split(",", 4)]
+    if len(fields) < 4 or not fields[0].endswith("M!"):
+        return None
+    address = fields[1] or fields[0][0]
+    try:
+        num_results = int(fields[3])
+    except ValueError:
+        return None
+    # values are printed as String(value, 10), always with a decimal point; the integer
+    # [elapsed ms] is only printed when the sensor finished early
+    tokens = NUMBER.findall(fields[4]) if len(fields) > 4 else []
+    values = [_to_value(token) for token in tokens if "." in token][:num_results]
+    values += [None] * (num_results - len(values))  # results the sensor did not send
+    return Reading(timestamp, address, values)
+
+
+def parse_analog_line(content: str, timestamp: float) -> Optional[Reading]:
+    """
+    Parse the A4/A5 differential value printed by loop() of main.ino
+
+    Args:
+        content: "[value]W*m-2"
+        timestamp: timestamp of the reading
+
+    Returns:
+        Reading or None if content is not an analog line
+    """
+
+    content = content.strip()
+    if not content.endswith(ANALOG_UNIT):
+        return None
+    try:
+        value = float(content[:-len(ANALOG_UNIT)])
+    except ValueError:
+        return None
+    return Reading(timestamp, ANALOG_ADDRESS, [value])
+
+
+def parse_sensing(lines: List[str], timestamp: float = None) -> List[Reading]:
+    """
+    Parse the response lines of the sensing command
+
+    Args:
+        lines: response lines without the end signal
+        timestamp: timestamp of the readings (default: now)
+
+    Returns:
+        readings in the order of the response
+    """
+
+    if timestamp is None:
+        timestamp = time.time()
+    readings = []
+    for content in lines:
+        reading = parse_sdi12_line(content, timestamp) or parse_analog_line(content, timestamp)
+        if reading is not None:
+            readings.append(reading)
+    return readings
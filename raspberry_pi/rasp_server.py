@@ -3,63 +3,92 @@ created by hychoi
 """
 import argparse
 import json
-import logging
-import matplotlib.pyplot as plt
+import numpy as np
 import os
-import serial
 import socket
+import threading
 import time
-from typing import Tuple, Union
-
-from const import APPROVED_IP, CMD_SENSING, CMD_CONTROL, INIT_CHAR, TERMINATE_CHAR
-from get_rgbd_img import get_rgbd_img
+import zlib
+from concurrent.futures import Future
+from typing import List, Tuple, Union
+
+from change_detection import ChangeDetector
+from config import load_config
+from const import (
+    CMD_SENSING,
+    CMD_CONTROL,
+    CMD_REQUEST,
+    CMD_SESSION,
+    CMD_PING,
+    CMD_SAMPLES,
+    CMD_SYNC,
+    CMD_METRICS,
+    CMD_STATUS,
+    CONFIG_FILE,
+    LEGACY_SHAPE,
+    SERIAL_WAIT,
+    RESTART_BACKOFF,
+    SESSION_IDLE_TIMEOUT,
+    SAMPLE_WRITE_TIMEOUT,
+    ACTUATORS,
+)
+from frame_archive import FrameArchive
+from frame_writer import FrameWriter
+from log_utils import setup_logging
+from metrics import registry
+from get_rgbd_img import RGBDCapture, fit_rgbd
+from observation import Reading, parse_sensing
+from record_store import RecordStore
+from scheduler import CaptureScheduler
+from serial_transport import SerialTransport
+from serial_worker import SerialWorker, PRIORITY_CONTROL, PRIORITY_SENSING
+from supervisor import SerialSupervisor
 from utils import get_KST_date, TimedInput
-
-
-def get_ip() -> str:
-    """
-    get my ip (In this case, get ip of currnent raspberry pi)
-
-    Returns:
-        ip
-    """
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    s.connect(("8.8.8.8", 80))
-    ip = s.getsockname()[0]
-    s.close()
-    return ip
+import actuation
+import wire
 
 
 def is_valid_actions(actions: str) -> bool:
     """
-    Check if actions are correct
+    Check if actions are correct (see actuation.parse_command)
      - init, terminate characters ('<' , '>')
-     - type (int or float)
+     - one fixed width field per actuator (const.ACTUATORS)
      - valid (range)
 
     Args:
-        actions: <The activation time of time> ex. <300>
+        actions: <05.1f,05.1f,03d,03d,03d> ex. <-10.0,066.5,255,150,128>
     Returns:
-        bool: True if actions are normal else raise error.
+        bool: True if actions are normal else False.
     """
 
-    data_start = actions.find(INIT_CHAR)
-    data_end = actions.find(TERMINATE_CHAR)
-    action_data = actions[data_start + 1:data_end]  # actions = <data>
     try:
-        action_data = int(action_data)
-    except:
+        actuation.parse_command(actions)
+    except ValueError:
         return False
+    return True
 
-    if len(action_data) != 1:
-        return False
 
-    if action_data < 0 and action_data > 300:
-        return False
-    return True
+def exchange(arduino: SerialTransport, cmd: str) -> Union[List[Reading], bool]:
+    """
+    One command and its response on the serial link (see commu_serial)
+    """
 
+    if cmd == CMD_SENSING:
+        timestamp = time.time()
+        with registry.timer("serial_sensing"):
+            lines = arduino.request(cmd, timeout=30)
+        return parse_sensing(lines, timestamp)
 
-def commu_serial(cmd: str, debug=False):
+    elif is_valid_actions(cmd):
+        with registry.timer("serial_control"):
+            arduino.request(cmd, timeout=30)  # main.ino answers "ack ..." and the end signal
+        return True
+
+    else:
+        raise ValueError(f"{cmd} is wrong command.")
+
+
+def commu_serial(cmd: str, debug=False) -> Union[List[Reading], None]:
     """
     Serial communication between Raspberry Pi and Arduino
     Update obs
@@ -68,6 +97,9 @@ def commu_serial(cmd: str, debug=False):
         cmd: "<obs>" or 25 characters <05.1f,05.1f,03d,03d,03d> (eg. <-10.0,066.5,255,150,128>)
         debug: if True, Don't send data to New Relic server
 
+    Returns:
+        readings parsed from the response of CMD_SENSING, True for acknowledged actions, None on failure
+
     Raises:
         ValueError:
             The command was not delivered properly.
@@ -76,74 +108,37 @@ def commu_serial(cmd: str, debug=False):
         TimeoutError
     """
 
-    global serial_restart, timeout_count
-    retry = 0
+    global timeout_count
     try:
-        if cmd == CMD_SENSING:
-            arduino.write(cmd.encode())
-            recv = 1
-            start = time.time()
-            while recv:
-                if arduino.in_waiting != 0:
-                    if retry > 2:
-                        raise ValueError(f"Retried {cmd.encode()} 3 times")
-                    content = arduino.readline()[:-2].decode()
-                    if "wrong" in content:  # The command was not delivered properly.
-                        logger.warning(content)
-                        arduino.write(cmd.encode())
-                        retry += 1
-                        continue
-
-                    elif "___" in content:  # End signal
-                        logger.debug(content)
-                        recv = 0
-
-                    else:
-                        logger.info(content)
-
-                if time.time() - start > 30:
-                    raise TimeoutError("Arduino obs timeout")
-
-        elif is_valid_actions(cmd):
-            arduino.write(cmd.encode())
-            recv = 1
-            start = time.time()
-            while recv:
-                if arduino.in_waiting != 0:
-                    if retry > 2:
-                        raise ValueError(f"Retried {cmd.encode()} 3 times")
-                    content = arduino.readline()[:-2].decode()
-                    if "wrong" in content:  # The command was not delivered properly.
-                        logger.warning(content)
-                        arduino.write(cmd.encode())
-                        retry += 1
-                        continue
-
-                    elif "___" in content:  # End signal
-                        logger.debug(content)
-                        recv = 0
-
-                    else:
-                        logger.info(content)
-
-                if time.time() - start > 30:
-                    raise TimeoutError("Arduino act timeout")
-
-        else:
-            raise ValueError(f"{cmd} is wrong command.")
+        for attempt in range(2):
+            # while the supervisor reopens the link, commands wait for it instead of failing at once
+            arduino = supervisor.wait(SERIAL_WAIT)
+            if arduino is None:
+                raise ConnectionError("Arduino is not connected")
+            try:
+                return exchange(arduino, cmd)
+            except OSError:
+                # the port failed under the command (USB glitch): send sensing again once the link is reopened;
+                # an actuator command may have been applied already (the pump would run twice): not acknowledged
+                if arduino.error is None or attempt or cmd != CMD_SENSING:
+                    raise
+                registry.count("serial_resends")
 
     except Exception as e:
         logger.error(f"serial commu failed - {e.__str__()}")
+        registry.count("serial_timeouts" if isinstance(e, TimeoutError) else "serial_errors")
+        if isinstance(e, ConnectionError):
+            return  # being reopened
         if (
             "timeout" not in e.__str__() or timeout_count > 1
-        ):  # 3rd timeout -> serial restart
+        ):  # 3rd timeout -> serial restart (the socket keeps serving)
             timeout_count = 0
-            serial_restart = 1
+            supervisor.restart(e.__str__())
         else:
             timeout_count += 1
 
 
-def recv_all(sock: socket.socket, count: int) -> Union[bytes, None]:
+def recv_all(sock: socket.socket, count: int) -> Union[bytearray, None]:
     """
     Receive all data from Server (or Client)
 
@@ -152,20 +147,421 @@ def recv_all(sock: socket.socket, count: int) -> Union[bytes, None]:
         count: the numbers of character
 
     Returns:
-        data: data byte object
-        None when the numbers of character != len(newbuf)
+        data: bytearray filled in place (wire.recv_into)
+        None when the connection is closed before count characters
     """
 
-    buf = b""
-    while count:
-        newbuf = sock.recv(count)
-        if not newbuf:
-            return None
-        buf += newbuf
-        count -= len(newbuf)
+    buf = bytearray(count)
+    try:
+        wire.recv_into(sock, memoryview(buf))
+    except ConnectionError:
+        return None
     return buf
 
 
+def capture_frame(debug=False, profile: str = None) -> Tuple[float, np.ndarray]:
+    """
+    Latest rgbd image from the camera, queued for saving unless debug
+
+    Args:
+        profile: name in config["capture_profiles"] (default: config["default_profile"])
+
+    Returns:
+        timestamp: capture time
+        rgbd_image: (H, W, 4) - BGR + depth
+    """
+
+    with registry.timer("capture"):
+        timestamp, rgbd_image = camera.latest(profile=profile or config["default_profile"])
+    if not debug:
+        frame_writer.submit(timestamp, rgbd_image)
+    return timestamp, rgbd_image
+
+
+def submit_sensing() -> Future:
+    """
+    Queue an SDI-12 scan on the serial worker. Concurrent requests share one scan (one set of readings):
+    the running one, or else the queued one, so a request waits for one scan at most, not for one per client.
+    """
+
+    return serial_worker.submit(CMD_SENSING, PRIORITY_SENSING, key=CMD_SENSING, share_running=True)
+
+
+def read_sensors(debug=False, pending: Future = None, timestamp: float = None) -> Union[List[dict], None]:
+    """
+    Sensor readings from the Arduino, saved locally unless debug
+
+    Args:
+        pending: submit_sensing() started earlier, so the exchange overlaps the capture
+            (default: sent now)
+        timestamp: capture timestamp shared with the frame of the same request
+            (default: time the command was sent to the Arduino)
+
+    Returns:
+        [Reading._asdict(), ...] or None when the serial communication failed
+    """
+
+    readings = (pending or submit_sensing()).result()
+    if readings is None:
+        return None
+    if timestamp is not None:
+        readings = [reading._replace(timestamp=timestamp) for reading in readings]
+    obs = [reading._asdict() for reading in readings]
+    if not debug:
+        store.append("obs", {"readings": obs}, timestamp=readings[0].timestamp if readings else timestamp)
+    return obs
+
+
+def take_sample():
+    """
+    Scheduled sample (see CaptureScheduler): the latest frame goes to the frame writer (archive)
+    and the sensor readings to the store as a "sample" record referring to the frame by its capture time.
+    Unlike frames of requests, the frame waits for room in the writer backlog; "missing" marks a dropped one.
+    """
+
+    pending = submit_sensing()
+    timestamp, rgbd_image = camera.latest(max_age=1, profile=config["schedule_profile"])
+    archived = frame_writer.submit(timestamp, rgbd_image, timeout=SAMPLE_WRITE_TIMEOUT)
+    readings = pending.result()
+    obs = None if readings is None else [reading._replace(timestamp=timestamp)._asdict() for reading in readings]
+    record = {"frame": timestamp, "shape": list(rgbd_image.shape[:2]), "readings": obs}
+    if not archived:
+        record["missing"] = True
+    store.append("sample", record, timestamp=timestamp)
+    logger.debug("sample done.")
+
+
+def load_frame(timestamp: float, shape: List[int]) -> Union[Tuple[np.ndarray, np.ndarray], None]:
+    """
+    Archived frame of a sample record
+
+    Returns:
+        color (H, W, 3), depth (H, W) or None if the frame is not archived (yet)
+    """
+
+    archive = FrameArchive(config["archive_dir"], tuple(shape))
+    index = archive.lookup(timestamp)
+    if index is None:
+        return None
+    _, color, depth = archive.frames(index, index + 1)
+    return color[0], depth[0]
+
+
+def send_archived_frame(client_socket: socket.socket, record: dict, encoding: dict = None):
+    """
+    Frame message of a sample record (frame_id: its capture time), or a "missing" message
+    when the frame was dropped or is not archived
+    """
+
+    frame = None if record.get("missing") else load_frame(record["frame"], record["shape"])
+    if frame is None:
+        wire.send_message(client_socket, {"type": "missing", "frame_id": record["frame"]})
+        return
+    header, payload = wire.encode_frame(
+        frame[0], frame[1], encoding, timestamp=record["frame"], frame_id=record["frame"]
+    )
+    wire.send_message(client_socket, header, payload)
+
+
+def send_samples(client_socket: socket.socket, request: dict):
+    """
+    Reply to {"cmd": "samples"}: sample records after request["cursor"] (or the latest one),
+    followed by one frame message per record when request["frames"]
+    """
+
+    if request.get("latest"):
+        latest = store.latest("sample")
+        records = [] if latest is None else [latest]
+    else:
+        records = list(store.since("sample", int(request.get("cursor", 0)), int(request.get("limit", 100))))
+    cursor = records[-1]["key"] if records else int(request.get("cursor", 0))
+    wire.send_message(client_socket, {"type": "samples", "records": records, "cursor": cursor})
+    if not request.get("frames"):
+        return
+    for record in records:
+        send_archived_frame(client_socket, record, request.get("encoding"))
+
+
+def send_sync(client_socket: socket.socket, request: dict):
+    """
+    Reply to {"cmd": "sync"}: every stored record after the cursors as one stream, without waiting for the client
+
+    Stream:
+        {"type": "records", "kind": str, "count": int, "cursor": int, "frames": int, "compression": "zlib"}
+            payload: zlib compressed json lines; followed by "frames" frame (or "missing") messages of the sample records
+        ...
+        {"type": "end", "cursors": {kind: int}}
+    The client resumes an interrupted sync with the cursor of the last records message it processed completely.
+    """
+
+    cursors = {kind: int(cursor) for kind, cursor in request.get("cursors", {}).items()}
+    kinds = request.get("kinds") or store.kinds()
+    chunk = int(request.get("chunk", 500))
+    for kind in kinds:
+        cursor = cursors.get(kind, 0)
+        while True:
+            records = list(store.since(kind, cursor, chunk))
+            if not records:
+                break
+            cursor = records[-1]["key"]
+            with_frames = [r for r in records if "frame" in r] if request.get("frames") else []
+            payload = zlib.compress("\n".join(json.dumps(r) for r in records).encode())
+            wire.send_message(
+                client_socket,
+                {
+                    "type": "records",
+                    "kind": kind,
+                    "count": len(records),
+                    "cursor": cursor,
+                    "frames": len(with_frames),
+                    "compression": "zlib",
+                },
+                payload,
+            )
+            for record in with_frames:
+                send_archived_frame(client_socket, record, request.get("encoding"))
+        cursors[kind] = cursor
+    wire.send_message(client_socket, {"type": "end", "cursors": cursors})
+
+
+def merge_control(queued: dict, control: dict) -> dict:
+    """
+    Coalesce a control request into the one still queued on serial_worker (see actuation.merge)
+    """
+
+    return {
+        "changes": actuation.merge(queued["changes"], control["changes"]),
+        "requests": queued["requests"] + control["requests"],
+    }
+
+
+def execute_control(control: dict) -> dict:
+    """
+    Send the actuator command of the changes on top of the current setpoints (runs on serial_worker).
+    A command that changes nothing (duplicate setpoints, pump off) is acknowledged without the serial link.
+
+    Args:
+        control: {"changes": validated {actuator: value}, "requests": number of requests coalesced}
+
+    Returns:
+        {"command": str, "state": setpoints, "sent": bool, "ack": seconds on the serial link, "coalesced": int}
+
+    Raises:
+        ValueError: The Arduino did not acknowledge the command.
+    """
+
+    global actuator_state
+    values, needed = actuation.apply(actuator_state, control["changes"])
+    command = actuation.format_command(values)
+    start = time.perf_counter()
+    if needed:
+        if commu_serial(command) is not True:
+            raise ValueError(f"{command} was not acknowledged")
+        actuator_state = {name: 0 if momentary else values[name] for name, _, _, _, momentary in ACTUATORS}
+    else:
+        registry.count("control_duplicates")
+    return {
+        "command": command,
+        "state": dict(actuator_state),
+        "sent": needed,
+        "ack": time.perf_counter() - start,
+        "coalesced": control["requests"] - 1,
+    }
+
+
+def perform_action(changes: dict, debug=False) -> dict:
+    """
+    Queue the actuator changes ahead of sensing commands and wait for the acknowledgement,
+    saved locally unless debug. Changes queued by other clients meanwhile are coalesced into one command:
+    later setpoints supersede earlier ones.
+
+    Args:
+        changes: {actuator: value} of some of const.ACTUATORS (ex. {"pump": 300, "fan": 128})
+
+    Returns:
+        execute_control result with "queued" (seconds waiting behind the running command)
+
+    Raises:
+        ValueError: invalid changes or not acknowledged
+    """
+
+    changes = actuation.validate(changes)
+    submitted = time.perf_counter()
+    pending = serial_worker.submit(
+        {"changes": changes, "requests": 1},
+        PRIORITY_CONTROL,
+        key=CMD_CONTROL,
+        merge=merge_control,
+        handler=execute_control,
+    )
+    result = dict(pending.result())
+    result["queued"] = max(0.0, time.perf_counter() - submitted - result["ack"])
+    registry.observe("control_queued", result["queued"])
+    registry.observe("control_ack", result["ack"])
+    if not debug:
+        store.append("act", {"changes": changes, "command": result["command"], "state": result["state"]})
+    logger.debug("act performed")
+    return result
+
+
+def frame_message(request: dict, timestamp: float, rgbd_image: np.ndarray) -> Tuple[dict, bytes]:
+    """
+    Frame message, or "unchanged" message when the frame held by the client
+    (request["since"], a frame id) is nearly identical to the current one (see change_detector)
+
+    Returns:
+        header, payload (see send_frame)
+    """
+
+    if change_detector is not None:
+        diff = change_detector.compare(request.get("since"), rgbd_image)
+        if diff is not None:
+            registry.count("frames_unchanged")
+            return {"type": "unchanged", "frame_id": request["since"], "timestamp": timestamp, **diff}, b""
+    with registry.timer("encode"):
+        header, payload = wire.encode_frame(
+            rgbd_image[..., :3],
+            rgbd_image[..., 3],
+            request.get("encoding"),
+            timestamp=timestamp,
+            frame_id=timestamp,
+            profile=request.get("profile") or config["default_profile"],
+        )
+    if change_detector is not None:
+        change_detector.remember(timestamp, rgbd_image)
+    return header, payload
+
+
+def send_frame(client_socket: socket.socket, header: dict, payload: bytes):
+    with registry.timer("send"):
+        wire.send_message(client_socket, header, payload)
+    registry.count("bytes_sent", len(payload))
+
+
+def handle_request(client_socket: socket.socket, request: dict, debug=False):
+    """
+    Serve a request of the binary protocol (see wire.py)
+
+    Args:
+        client_socket: Accepted client socket object
+        request:
+            {"cmd": "sensing", "encoding": {"color": str, "depth": str}, "readings": bool, "since": frame id,
+             "profile": name in config["capture_profiles"], "combined": bool (readings in the frame header)}
+            {"cmd": "samples", "cursor": int, "limit": int, "frames": bool, "encoding": dict} or {"cmd": "samples", "latest": true}
+            {"cmd": "sync", "cursors": {kind: int}, "kinds": list, "frames": bool, "encoding": dict, "chunk": int}
+            {"cmd": "control", "actuators": {name: value}} (const.ACTUATORS), or {"cmd": "control", "pump": int}
+            {"cmd": "ping"}
+            {"cmd": "metrics"}
+            {"cmd": "status"} (health of the serial link, camera, ...)
+        debug: if True, do not save the data in local directory
+
+    Raises:
+        ValueError: the request failed (ex. request["cmd"] is not a correct command); the client got an error message
+        ConnectionError: the client closed the connection
+    """
+
+    cmd = request.get("cmd")
+    registry.count(f"requests.{cmd}")
+    start = time.perf_counter()
+    try:
+        if cmd == CMD_SENSING:
+            # the serial exchange (seconds) runs while the frame is captured and encoded;
+            # frame and readings share the capture timestamp of the frame
+            pending = submit_sensing() if request.get("readings", True) else None
+            timestamp, rgbd_image = capture_frame(debug, request.get("profile"))
+            header, payload = frame_message(request, timestamp, rgbd_image)
+            if pending is not None and request.get("combined"):
+                header.update(readings=read_sensors(debug, pending, timestamp), capture_time=timestamp)
+                send_frame(client_socket, header, payload)
+                logger.debug("img and obs done.")
+            else:
+                send_frame(client_socket, header, payload)
+                logger.debug("img done.")
+                if pending is not None:
+                    readings = read_sensors(debug, pending, timestamp)
+                    wire.send_message(client_socket, {"type": "obs", "readings": readings, "capture_time": timestamp})
+                    logger.debug("obs done.")
+
+        elif cmd == CMD_SAMPLES:
+            if store is None:
+                raise ValueError("samples are not stored in debug mode")
+            send_samples(client_socket, request)
+
+        elif cmd == CMD_SYNC:
+            if store is None:
+                raise ValueError("records are not stored in debug mode")
+            send_sync(client_socket, request)
+
+        elif cmd == CMD_CONTROL:
+            changes = dict(request.get("actuators") or {})
+            if "pump" in request:
+                changes["pump"] = request["pump"]
+            if not changes:
+                raise ValueError("no actuators in the control request")
+            result = perform_action(changes, debug)
+            wire.send_message(client_socket, {"type": "ack", "cmd": cmd, **result})
+
+        elif cmd == CMD_PING:
+            wire.send_message(client_socket, {"type": "pong"})
+
+        elif cmd == CMD_STATUS:
+            send_status(client_socket)
+
+        elif cmd == CMD_METRICS:
+            snapshot = registry.snapshot()
+            if frame_writer is not None:
+                snapshot["frame_writer"] = frame_writer.stats()
+            wire.send_message(client_socket, {"type": "metrics", "metrics": snapshot})
+
+        else:
+            raise ValueError(f"{cmd} is not a correct command.")
+
+    except ConnectionError:
+        raise  # the client is gone, no one to answer
+    except Exception as e:
+        # answer every failure (ex. a camera TimeoutError): a silent close marks this node as legacy on the client
+        registry.count("request_errors")
+        message = e.__str__() or type(e).__name__
+        try:
+            wire.send_message(client_socket, {"type": "error", "message": message})
+        except OSError:
+            raise e
+        raise ValueError(message)
+
+    registry.observe(f"request.{cmd}", time.perf_counter() - start)
+
+
+def serve_session(client_socket: socket.socket, addr: str, debug=False):
+    """
+    Serve requests of the binary protocol on one connection until the client sends "close"
+    or the connection stays idle for SESSION_IDLE_TIMEOUT.
+    A failed request is answered with an error message and does not end the session.
+
+    Args:
+        client_socket: Accepted client socket object
+        addr: Address of accepted client socket
+        debug: if True, do not save the data in local directory
+    """
+
+    client_socket.settimeout(SESSION_IDLE_TIMEOUT)
+    wire.enable_keepalive(client_socket)
+    while True:
+        try:
+            request, _ = wire.recv_message(client_socket)
+        except (ConnectionError, socket.timeout):
+            logger.debug(f"session closed - {str(addr[0])}:{str(addr[1])}")
+            return
+        if request.get("cmd") == "close":
+            return
+        try:
+            handle_request(client_socket, request, debug)
+        except ValueError as e:
+            logger.error(e.__str__())
+            continue
+        if request.get("cmd") != CMD_PING:
+            logger.info(f"{request.get('cmd')} - received from {str(addr[0])}:{str(addr[1])} (session)")
+
+
 def binder(client_socket: socket.socket, addr: str, debug=False):
     """
     Data communication between server and raspberry pi
@@ -183,40 +579,37 @@ def binder(client_socket: socket.socket, addr: str, debug=False):
     try:
         cmd = recv_all(client_socket, 7).decode()
         logger.debug(f"cmd: {cmd}")
-        if cmd == CMD_SENSING:
-            img_save_path = os.path.join(epi_name, "img")
-            if debug: img_save_path = None
-            rgbd_image = get_rgbd_img(img_save_path)
-            if not debug:
-                plt.imsave(
-                    os.path.join(epi_name, "img", "RGB" + get_KST_date() + ".jpg"), rgbd_image[..., :3]
-                )
-                plt.imsave(
-                    os.path.join(epi_name, "img", "depth" + get_KST_date() + ".jpg"), rgbd_image[..., 3:]
-                )
-            stringimg = rgbd_image.tobytes()
-            client_socket.sendall((str(len(stringimg))).encode().ljust(16) + stringimg)
+        if cmd == CMD_REQUEST:
+            request, _ = wire.recv_message(client_socket)
+            handle_request(client_socket, request, debug)
+            cmd = f"{cmd}:{request.get('cmd')}"
+
+        elif cmd == CMD_SESSION:
+            serve_session(client_socket, addr, debug)
+
+        elif cmd == CMD_SENSING:
+            # legacy protocol: 16 bytes length + rgbd_image.tobytes() (uint16)
+            registry.count(f"requests.{cmd}")
+            start = time.perf_counter()
+            pending = submit_sensing()
+            timestamp, rgbd_image = capture_frame(debug)
+            # old clients reshape to LEGACY_SHAPE: the default frame is 540 x 960 on an L515
+            stringimg = fit_rgbd(rgbd_image, LEGACY_SHAPE).tobytes()
+            with registry.timer("send"):
+                client_socket.sendall((str(len(stringimg))).encode().ljust(16) + stringimg)
+            registry.count("bytes_sent", len(stringimg))
             logger.debug("img done.")
-            obs = commu_serial(CMD_SENSING)
-            if not debug:
-                with open(
-                    os.path.join(epi_name, "obs", "obs" + get_KST_date() + ".json"), "w"
-                ) as f:
-                    json.dump(obs, f)
-            obs_string = json.dumps(obs)
+            obs_string = json.dumps(read_sensors(debug, pending, timestamp))
             client_socket.sendall(
                 (str(len(obs_string))).encode().ljust(16) + obs_string.encode()
             )
             logger.debug("obs done.")
+            registry.observe(f"request.{cmd}", time.perf_counter() - start)
 
         elif cmd == CMD_CONTROL:
+            registry.count(f"requests.{cmd}")
             control = recv_all(client_socket, 3).decode()
-            commu_serial("<" + control + ">", debug)
-            with open(
-                os.path.join(epi_name, "act", "act" + get_KST_date() + ".json"), "w"
-            ) as f:
-                json.dump({"pump": int(control)}, f)
-            logger.debug("act performed")
+            perform_action({"pump": int(control)}, debug)
         else:
             logger.warning(cmd)
             raise ValueError(f"{cmd} is not a correct command.")
@@ -224,60 +617,103 @@ def binder(client_socket: socket.socket, addr: str, debug=False):
         logger.info(f"{cmd} - received from {str(addr[0])}:{str(addr[1])}\n")
 
     except Exception as e:
+        registry.count("socket_timeouts" if isinstance(e, socket.timeout) else "binder_errors")
         logger.error(e.__str__())
 
     finally:
         client_socket.close()
 
 
-def Server(
-    USB: str, BRATE: int, HOST: str, PORT: int
-) -> Tuple[serial.Serial, socket.socket]:
+def open_arduino(USB: str, BRATE: int) -> SerialTransport:
     """
-    Start rasp server to communicate with Data server (using socket).
+    Open the serial link and wait for the boot handshake of the Arduino (opening the port resets it)
 
     Args:
         USB: USB port where Arduino is connected; ex) '/dev/ttyACM0'
         BRATE: brate rate for Arduino
-        HOST: Current Raspberry Pi IP address
-        PORT: Port designation (default: 9999)
 
     Returns:
-        arduino: serial.Serial
-        server_socket: socket.socket
+        arduino: SerialTransport
+
+    Raises:
+        ValueError: The Arduino found no sensors.
     """
 
-    # serial ready (Arduino)
-    arduino = serial.Serial(USB, baudrate=BRATE, timeout=1)
+    arduino = SerialTransport(USB, baudrate=BRATE)
     logger.info(f"Arduino port: {str(arduino.name)}")
 
-    ready = 1
     init = 0
-    start = time.time()
-    while ready:
-        if arduino.in_waiting != 0:
-            content = arduino.readline()[:-2].decode()
-            if "Scanning all addresses, please wait..." in content:
-                init = 1
-            if "No sensors found, please check connections and restart the Arduino." in content:
-                raise ValueError("Arudino system needs to be checked.")
-            if init:
-                logger.info(content)
-            if ("Total number of sensors found" in content) and init:
-                ready = 0
-
-        if time.time() - start > 30:  # when data is not coming
-            logger.warning("There is no proper incoming data from the Arduino.")
-            ready = 0
-
-    # socket ready (Server)
+    for content in arduino.lines(timeout=30, backlog=True):
+        if "Scanning all addresses, please wait..." in content:
+            init = 1
+        if "No sensors found, please check connections and restart the Arduino." in content:
+            arduino.close()
+            raise ValueError("Arudino system needs to be checked.")
+        if init:
+            logger.info(content)
+        if ("Total number of sensors found" in content) and init:
+            break
+    else:  # when data is not coming
+        logger.warning("There is no proper incoming data from the Arduino.")
+    return arduino
+
+
+def reset_actuators(arduino: SerialTransport):
+    global actuator_state
+    actuator_state = actuation.initial_state()  # opening the port resets the Arduino
+
+
+def Server(HOST: str, PORT: int) -> socket.socket:
+    """
+    Start rasp server to communicate with Data server (using socket).
+    The Arduino is connected separately (see supervisor), so the socket does not wait for it.
+
+    Args:
+        HOST: Current Raspberry Pi IP address
+        PORT: Port designation (default: 9999)
+
+    Returns:
+        server_socket: socket.socket
+    """
+
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server_socket.bind((HOST, PORT))
-    server_socket.listen()
+    try:
+        server_socket.bind((HOST, PORT))
+        server_socket.listen()
+    except OSError:
+        server_socket.close()
+        raise
+    server_socket.settimeout(1)  # wake up regularly to check termination
     logger.info(f"Rasp is ready to service... ({HOST}:{PORT})\n")
 
-    return arduino, server_socket
+    return server_socket
+
+
+def send_status(client_socket: socket.socket):
+    """
+    Health of every component: {"type": "status", "ok": bool, "uptime": s, "components": {name: {"ok": bool, ...}}}
+    """
+
+    components = {
+        "serial": supervisor.stats(),
+        "serial_worker": serial_worker.stats(),
+        "camera": camera.stats(),
+    }
+    if scheduler is not None:
+        components["scheduler"] = scheduler.stats()
+    if frame_writer is not None:
+        stats = frame_writer.stats()
+        components["frame_writer"] = {"ok": stats["backlog"] < stats["max_backlog"], **stats}
+    wire.send_message(
+        client_socket,
+        {
+            "type": "status",
+            "ok": all(component["ok"] for component in components.values()),
+            "uptime": time.time() - started,
+            "components": components,
+        },
+    )
 
 
 def main(args):
@@ -285,9 +721,10 @@ def main(args):
     Raspberry Pi Server
     Communicate with server by socket communication
     Communicate with arduino by serial communication
+    Each client is served in its own thread; serial commands go through serial_worker
 
     Args:
-        args (parser.parse_args()) - port:9999 (default)
+        args (parser.parse_args()) - debug; addresses, devices and paths come from config (see config.py)
 
     KeyboardInterrupt:
         Terminate server
@@ -296,34 +733,69 @@ def main(args):
         "Socket error - ~": Error raised when socket.accept()
         "Binder error - ~": Error raised in binder()
     """
-    global serial_restart, arduino
+    global supervisor, camera, serial_worker, store, frame_writer, change_detector, scheduler, started
     EXIT = 0
+    started = time.time()
 
     if not args.debug:
-        # save data locally
+        # save data locally; observations and actions of every run go to one store
         os.makedirs(epi_name, exist_ok=True)
-        os.makedirs(os.path.join(epi_name, "img"), exist_ok=True)
-        os.makedirs(os.path.join(epi_name, "obs"), exist_ok=True)
-        os.makedirs(os.path.join(epi_name, "act"), exist_ok=True)
-
+        img_dir = None
+        if config["save_images"]:
+            img_dir = os.path.join(epi_name, "img")
+            os.makedirs(img_dir, exist_ok=True)
+        store = RecordStore(config["store_dir"])
+        frame_writer = FrameWriter(img_dir, archive_root=config["archive_dir"])
+        frame_writer.start()
+
+    # camera and serial link are kept by their own threads across socket restarts, and vice versa
+    camera = RGBDCapture(
+        preprocessing=config["preprocessing"],
+        profiles=config["capture_profiles"],
+        profile=config["default_profile"],
+    )
+    camera.start()
+    supervisor = SerialSupervisor(
+        lambda: open_arduino(config["usb"], config["baudrate"]), reset_actuators, *RESTART_BACKOFF
+    )
+    supervisor.start()
+    if config["change_detection"] is not None:
+        change_detector = ChangeDetector(**config["change_detection"])
+    serial_worker = SerialWorker(commu_serial)
+    serial_worker.start()
+    if not args.debug and config["schedule_interval"]:
+        scheduler = CaptureScheduler(config["schedule_interval"], take_sample)
+        scheduler.start()
+
+    server_socket = None
+    delay = RESTART_BACKOFF[0]
     while True:
         if EXIT:
             break
-        ip = get_ip()
-        arduino, server_socket = Server(USB=USB, BRATE=BRATE, HOST=ip, PORT=args.port)
+        try:
+            server_socket = Server(HOST=config["host"], PORT=config["port"])
+            delay = RESTART_BACKOFF[0]
+        except OSError as e:  # address not assigned yet, port in use, ...
+            logger.error(f"Socket error - {e.__str__()}, retry in {delay:.0f} s")
+            registry.count("socket_restarts")
+            time.sleep(delay)
+            delay = min(delay * 2, RESTART_BACKOFF[1])
+            continue
 
         while True:
             try:
-                while True:
-                    client_socket, addr = server_socket.accept()
-                    client_socket.settimeout(30)
-                    if "*" in APPROVED_IP or addr[0] in APPROVED_IP:
-                        break
+                client_socket, addr = server_socket.accept()
+                if not ("*" in config["approved_ip"] or addr[0] in config["approved_ip"]):
                     client_socket.close()
                     logger.warning(str(addr[0]) + ":" + str(addr[1]) + " is refused.\n")
+                    continue
+                client_socket.settimeout(30)
                 logger.debug("________________________________________________")
                 logger.debug("Connected by " + str(addr[0]) + ":" + str(addr[1]))
 
+            except socket.timeout:
+                continue
+
             except KeyboardInterrupt:
                 # terminate the server: ctrl + C
                 while True:
@@ -354,30 +826,33 @@ def main(args):
                     continue
 
             except Exception as e:
+                # only the listening socket is reopened; the serial link and the camera keep running
                 server_socket.close()
-                arduino.close()
                 logger.error(f"Socket error - {e.__str__()}")
+                registry.count("socket_restarts")
+                time.sleep(1)
                 break
 
             try:
-                binder(client_socket, addr, args.debug)
+                threading.Thread(
+                    target=binder, args=(client_socket, addr, args.debug), daemon=True
+                ).start()
 
             except Exception as e:
-                server_socket.close()
-                arduino.close()
+                client_socket.close()
                 logger.error(f"Binder error - {e.__str__()}")
-                break
-
-            if serial_restart:
-                logger.error("Restart due to serial commu problem")
-                server_socket.close()
-                arduino.close()
-                time.sleep(1)
-                serial_restart = 0
-                break
 
-    server_socket.close()
-    arduino.close()
+    if scheduler is not None:
+        scheduler.stop()
+    if server_socket is not None:
+        server_socket.close()
+    serial_worker.stop()
+    supervisor.stop()
+    camera.stop()
+    if store is not None:
+        store.close()
+    if frame_writer is not None:
+        frame_writer.stop()
 
 
 if __name__ == "__main__":
@@ -386,39 +861,44 @@ if __name__ == "__main__":
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
     parser.add_argument(
-        "-p", "--port", type=int, default=9999, help="PORT for socket communication"
+        "-c", "--config", default=CONFIG_FILE, help="JSON configuration (see config.py); defaults if missing"
+    )
+    parser.add_argument(
+        "-p", "--port", type=int, default=None, help="PORT for socket communication (default: config, 9999)"
     )
     parser.add_argument(
         "-d", "--debug", action="store_true", help="Do not save files"
     )
+    parser.add_argument(
+        "--usb", default=None, help="Serial port of the Arduino (ex. a fake_arduino.py pty; default: config)"
+    )
+    parser.add_argument(
+        "--host", default=None, help="Address to listen on (default: config, all interfaces)"
+    )
     args = parser.parse_args()
 
-    serial_restart = 0
+    # command line options override the configuration file
+    config = load_config(args.config)
+    for key in ("port", "usb", "host"):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+
     timeout_count = 0
+    started = None
 
     # Arduino address
-    arduino = None
-    USB = "/dev/ttyACM0"  # fixed
-    BRATE = 115200  # fixed
-
-    epi_name = f"Server{get_KST_date()}"
-
-    # logging
-    logger = logging.getLogger("Server")
-    logger.setLevel(logging.DEBUG)
-    formatter = logging.Formatter(
-        "[%(asctime)s] - %(name)s - [%(levelname)s] - %(message)s", "%Y-%m-%d %H:%M:%S"
-    )
-
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(formatter)
-    stream_handler.setLevel(logging.INFO)
-    logger.addHandler(stream_handler)
-    
-    if not args.debug:
-        file_handler = logging.FileHandler(os.path.join(epi_name, "log.txt"))
-        file_handler.setFormatter(formatter)
-        file_handler.setLevel(logging.DEBUG)
-        logger.addHandler(file_handler)
+    supervisor = None
+    camera = None
+    serial_worker = None
+    store = None
+    frame_writer = None
+    change_detector = None
+    scheduler = None
+    actuator_state = actuation.initial_state()
+
+    epi_name = os.path.join(config["run_dir"], f"Server{get_KST_date()}")
+
+    # logging: console (INFO) and epi_name/log.txt (DEBUG), written by a background thread
+    logger = setup_logging("Server", None if args.debug else epi_name)
 
     main(args)
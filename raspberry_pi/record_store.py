@@ -0,0 +1,194 @@
+import datetime
+import json
+import os
+import threading
+import time
+from typing import Iterator, List, Optional
+
+KST = datetime.timezone(datetime.timedelta(hours=9))
+
+
+def key_to_time(key: int) -> float:
+    """
+    key (nanoseconds since epoch) -> time.time()
+    """
+    return key / 1e9
+
+
+def time_to_key(timestamp: float) -> int:
+    return int(timestamp * 1e9)
+
+
+class RecordStore:
+    """
+    Append-only storage for observations and actions.
+
+    Records of a kind are appended as json lines to segment files partitioned by day (KST):
+        root/<kind>/<YYYY-MM-DD>/<first key>.jsonl
+    A segment is closed after segment_records records, so a day holds a handful of files instead of one per sample.
+    Every record gets a key: nanoseconds since epoch, strictly increasing within the store,
+    so records of the same minute (or the same clock tick) never collide.
+
+    Args:
+        root: directory of the store
+        segment_records: records per segment file
+    """
+
+    def __init__(self, root: str, segment_records: int = 1000):
+        self.root = root
+        self.segment_records = segment_records
+        self._lock = threading.Lock()
+        self._last_key = {}
+        self._segments = {}  # kind -> [file, day, count]
+        os.makedirs(root, exist_ok=True)
+
+    def kinds(self) -> List[str]:
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def _days(self, kind: str) -> List[str]:
+        path = os.path.join(self.root, kind)
+        if not os.path.isdir(path):
+            return []
+        return sorted(os.listdir(path))
+
+    def _segment_files(self, kind: str, day: str) -> List[str]:
+        path = os.path.join(self.root, kind, day)
+        names = sorted(
+            (name for name in os.listdir(path) if name.endswith(".jsonl")), key=lambda name: int(name[:-6])
+        )
+        return [os.path.join(path, name) for name in names]
+
+    def last_key(self, kind: str) -> int:
+        """
+        The latest key of kind (0 if empty)
+        """
+
+        if kind not in self._last_key:
+            last = 0
+            for day in reversed(self._days(kind)):
+                for path in reversed(self._segment_files(kind, day)):
+                    for record in self._read(path):
+                        last = max(last, record["key"])
+                    if last:
+                        break
+                if last:
+                    break
+            self._last_key[kind] = last
+        return self._last_key[kind]
+
+    def _next_key(self, kind: str, timestamp: Optional[float]) -> int:
+        key = time.time_ns() if timestamp is None else time_to_key(timestamp)
+        key = max(key, self.last_key(kind) + 1)
+        self._last_key[kind] = key
+        return key
+
+    def _segment(self, kind: str, key: int):
+        day = datetime.datetime.fromtimestamp(key_to_time(key), tz=KST).strftime("%Y-%m-%d")
+        segment = self._segments.get(kind)
+        if segment is not None and (segment[1] != day or segment[2] >= self.segment_records):
+            segment[0].close()
+            segment = None
+        if segment is None:
+            path = os.path.join(self.root, kind, day)
+            os.makedirs(path, exist_ok=True)
+            segment = [open(os.path.join(path, f"{key}.jsonl"), "a"), day, 0]
+            self._segments[kind] = segment
+        return segment
+
+    def append(self, kind: str, record: dict, timestamp: float = None) -> int:
+        """
+        Append a record
+
+        Args:
+            kind: ex. "obs", "act"
+            record: json serializable dict
+            timestamp: time.time() of the record used for the key (default: now)
+
+        Returns:
+            key of the record
+        """
+
+        with self._lock:
+            key = self._next_key(kind, timestamp)
+            segment = self._segment(kind, key)
+            segment[0].write(json.dumps({"key": key, **record}) + "\n")
+            segment[0].flush()
+            segment[2] += 1
+        return key
+
+    @staticmethod
+    def _read(path: str) -> Iterator[dict]:
+        with open(path) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:  # torn last line after a power loss
+                    continue
+
+    def query(self, kind: str, start: float = None, end: float = None) -> Iterator[dict]:
+        """
+        Records of kind with start <= time < end, in key order
+
+        Args:
+            kind: ex. "obs", "act"
+            start: time.time() (default: the first record)
+            end: time.time() (default: the last record)
+        """
+
+        start_key = 0 if start is None else time_to_key(start)
+        end_key = None if end is None else time_to_key(end)
+        yield from self.since(kind, start_key - 1, end_key=end_key)
+
+    def since(self, kind: str, cursor: int = 0, limit: int = None, end_key: int = None) -> Iterator[dict]:
+        """
+        Records of kind with key > cursor, in key order
+
+        Args:
+            kind: ex. "obs", "act"
+            cursor: the last key already read (0: from the beginning)
+            limit: the maximum number of records
+            end_key: only keys < end_key
+        """
+
+        with self._lock:
+            segment = self._segments.get(kind)
+            if segment is not None:
+                segment[0].flush()
+
+        count = 0
+        first_day = datetime.datetime.fromtimestamp(key_to_time(max(cursor, 0)), tz=KST).strftime("%Y-%m-%d")
+        for day in self._days(kind):
+            if day < first_day:
+                continue
+            files = self._segment_files(kind, day)
+            for i, path in enumerate(files):
+                # the next segment starts after cursor: nothing newer in this one
+                if i + 1 < len(files) and int(os.path.basename(files[i + 1])[:-6]) <= cursor:
+                    continue
+                if end_key is not None and int(os.path.basename(path)[:-6]) >= end_key:
+                    return
+                for record in self._read(path):
+                    if record["key"] <= cursor:
+                        continue
+                    if end_key is not None and record["key"] >= end_key:
+                        return
+                    yield record
+                    count += 1
+                    if limit is not None and count >= limit:
+                        return
+
+    def latest(self, kind: str) -> Optional[dict]:
+        """
+        The last record of kind (None if empty)
+        """
+
+        last_key = self.last_key(kind)
+        if not last_key:
+            return None
+        return next(self.since(kind, last_key - 1), None)
+
+    def close(self):
+        with self._lock:
+            for segment in self._segments.values():
+                segment[0].close()
+            self._segments.clear()
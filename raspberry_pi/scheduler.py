@@ -0,0 +1,68 @@
+import logging
+import math
+import threading
+import time
+from typing import Callable
+
+
+class CaptureScheduler:
+    """
+    Run a sampling function on a fixed cadence, independent of server polling.
+    Runs are aligned to multiples of interval on the wall clock (ex. every 5 minutes at :00, :05, ...),
+    so timing does not drift with the duration of a run. A run that overlaps the next slot skips it.
+
+    Args:
+        interval: seconds between runs
+        sample: function taking one sample
+    """
+
+    def __init__(self, interval: float, sample: Callable[[], None]):
+        self.interval = interval
+        self.sample = sample
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_run = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.logger = logging.getLogger("Server")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="CaptureScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "ok": self._thread is not None and self._thread.is_alive(),
+            "interval": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_run": self.last_run,
+        }
+
+    def _next_slot(self, now: float) -> float:
+        return math.floor(now / self.interval + 1) * self.interval
+
+    def _run(self):
+        slot = self._next_slot(time.time())
+        while not self._stop.wait(max(0, slot - time.time())):
+            self.last_run = time.time()
+            try:
+                self.sample()
+                self.runs += 1
+            except Exception as e:
+                self.failures += 1
+                self.logger.error(f"Scheduled sample failed - {e.__str__()}")
+            next_slot = self._next_slot(time.time())
+            self.skipped += int(round((next_slot - slot) / self.interval)) - 1
+            slot = next_slot
@@ -0,0 +1,161 @@
+import collections
+import logging
+import queue
+import threading
+import time
+from typing import Iterator, List
+
+import serial
+
+from metrics import registry
+
+
+class SerialTransport:
+    """
+    Line based serial link to the Arduino.
+    A single reader thread blocks on the port (no busy polling), splits the incoming bytes into lines
+    and hands every line to the caller currently waiting for a response.
+    Lines arriving while nobody waits are logged and kept in a small backlog.
+
+    Args:
+        port: USB port where Arduino is connected; ex) '/dev/ttyACM0'
+        baudrate: baud rate for Arduino
+        read_timeout: seconds a blocking read waits before the reader thread checks for close()
+    """
+
+    def __init__(self, port: str, baudrate: int, read_timeout: float = 1):
+        self.serial = serial.Serial(port, baudrate=baudrate, timeout=read_timeout)
+        self.name = self.serial.name
+        self.error = None
+
+        self._waiter = None  # queue.Queue of the caller waiting for lines
+        self._waiter_lock = threading.Lock()
+        self._backlog = collections.deque(maxlen=100)
+        self._closed = threading.Event()
+        self.logger = logging.getLogger("Server")
+        self._thread = threading.Thread(target=self._read_loop, name="SerialReader", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._closed.set()
+        self._thread.join(timeout=self.serial.timeout + 1)
+        self.serial.close()
+
+    def write(self, data: str):
+        self.serial.write(data.encode())
+
+    def lines(self, timeout: float, backlog: bool = False) -> Iterator[str]:
+        """
+        Yield lines from the Arduino until the deadline.
+        Lines are collected from the moment of this call, so a command written afterwards cannot be missed.
+
+        Args:
+            timeout: seconds from now until the deadline
+            backlog: if True, start with the lines received while nobody was waiting
+
+        Raises:
+            serial.SerialException: the port failed while waiting
+        """
+
+        inbox = queue.Queue()
+        with self._waiter_lock:
+            if backlog:
+                for line in self._backlog:
+                    inbox.put(line)
+            self._backlog.clear()
+            self._waiter = inbox
+        return self._drain(inbox, time.time() + timeout)
+
+    def _drain(self, inbox: queue.Queue, deadline: float) -> Iterator[str]:
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return
+                try:
+                    line = inbox.get(timeout=remaining)
+                except queue.Empty:
+                    return
+                if isinstance(line, Exception):
+                    raise line
+                yield line
+        finally:
+            with self._waiter_lock:
+                if self._waiter is inbox:
+                    self._waiter = None
+
+    def request(
+        self, cmd: str, timeout: float = 30, end: str = "___", retries: int = 3
+    ) -> List[str]:
+        """
+        Send a command and collect the response lines until the end signal
+
+        Args:
+            cmd: command for the Arduino
+            timeout: deadline for the whole exchange (seconds)
+            end: end signal of the response
+            retries: how many times the command is resent when the Arduino answers "wrong"
+
+        Returns:
+            response lines without the end signal
+
+        Raises:
+            ValueError: The command was not delivered properly after retries
+            TimeoutError: The end signal did not arrive before the deadline
+        """
+
+        retry = 0
+        response = []
+        response_lines = self.lines(timeout)
+        # the newline ends Serial.readStringUntil() at once instead of after its 1 s timeout
+        self.write(cmd + "\n")
+        for content in response_lines:
+            if "wrong" in content:  # The command was not delivered properly.
+                self.logger.warning(content)
+                registry.count("serial_retries")
+                if retry >= retries:
+                    raise ValueError(f"Retried {cmd.encode()} {retries} times")
+                self.write(cmd + "\n")
+                retry += 1
+
+            elif end in content:  # End signal
+                self.logger.debug(content)
+                return response
+
+            else:
+                self.logger.debug(content)
+                response.append(content)
+
+        raise TimeoutError(f"Arduino {cmd} timeout")
+
+    def _dispatch(self, line):
+        with self._waiter_lock:
+            waiter = self._waiter
+            if waiter is None and isinstance(line, str):
+                self._backlog.append(line)
+        if waiter is not None:
+            waiter.put(line)
+        elif isinstance(line, str):
+            self.logger.debug(f"unsolicited: {line}")
+
+    def _read_loop(self):
+        buf = bytearray()
+        while not self._closed.is_set():
+            try:
+                # blocks until at least one byte arrives or read_timeout passes
+                chunk = self.serial.read(max(1, self.serial.in_waiting))
+            except Exception as e:
+                if not self._closed.is_set():
+                    self.error = e
+                    self._dispatch(serial.SerialException(f"serial read failed - {e.__str__()}"))
+                return
+            if not chunk:
+                continue
+            buf += chunk
+            while True:
+                idx = buf.find(b"\n")
+                if idx < 0:
+                    break
+                line = bytes(buf[:idx]).rstrip(b"\r").decode(errors="replace")
+                del buf[:idx + 1]
+                self._dispatch(line)
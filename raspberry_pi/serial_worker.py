@@ -0,0 +1,145 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, List, Optional
+
+PRIORITY_CONTROL = 0  # actuator commands go before queued sensing
+PRIORITY_SENSING = 1
+
+
+class _Job:
+    def __init__(self, cmd: Any, handler: Callable[[Any], Any], key: Optional[Hashable]):
+        self.cmd = cmd
+        self.handler = handler
+        self.key = key
+        self.futures: List[Future] = []
+        self.submitted = time.perf_counter()
+
+
+class SerialWorker:
+    """
+    Single thread that owns the serial link to the Arduino.
+    Commands from every client are queued and executed one at a time,
+    so they never interleave on the serial port.
+
+    The queue is ordered by priority (then by arrival): a control command preempts queued sensing commands,
+    but never interrupts the running one. Queued commands with the same key are coalesced into one job
+    (see submit), which resolves the futures of every caller; commands that only read (ex. sensing)
+    may also share the running job of their key.
+
+    Args:
+        handler: function executing one command on the serial port (ex. commu_serial)
+    """
+
+    def __init__(self, handler: Callable[[str], Any]):
+        self.handler = handler
+        self.queue = queue.PriorityQueue()
+        self.coalesced = 0
+        self._seq = itertools.count()
+        self._queued = {}  # key -> _Job not started yet
+        self._running: Optional[_Job] = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.logger = logging.getLogger("Server")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="SerialWorker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self.queue.put((float("inf"), next(self._seq), None))
+            self._thread.join()
+            self._thread = None
+
+    def submit(
+        self,
+        cmd: Any,
+        priority: int = PRIORITY_SENSING,
+        key: Optional[Hashable] = None,
+        merge: Callable[[Any, Any], Any] = None,
+        handler: Callable[[Any], Any] = None,
+        share_running: bool = False,
+    ) -> Future:
+        """
+        Queue a command for the Arduino
+
+        Args:
+            cmd: command passed to the handler
+            priority: PRIORITY_CONTROL or PRIORITY_SENSING (lower first)
+            key: coalesce with a queued command of the same key, ex. "control"
+            merge: merge(queued cmd, cmd) -> cmd of the coalesced job (default: cmd supersedes)
+            handler: handler of this command (default: self.handler)
+            share_running: take the result of the running job of the same key, if any (cmd is not merged),
+                ex. sensor readings, which a command started a moment ago answers as well
+
+        Returns:
+            Future resolved with the handler result
+        """
+
+        future = Future()
+        with self._lock:
+            job = self._queued.get(key) if key is not None else None
+            if job is None and share_running and key is not None and self._running is not None:
+                if self._running.key == key:
+                    self._running.futures.append(future)
+                    self.coalesced += 1
+                    return future
+            if job is not None:
+                job.cmd = merge(job.cmd, cmd) if merge is not None else cmd
+                job.futures.append(future)
+                self.coalesced += 1
+                return future
+            job = _Job(cmd, handler or self.handler, key)
+            job.futures.append(future)
+            if key is not None:
+                self._queued[key] = job
+        self.queue.put((priority, next(self._seq), job))
+        return future
+
+    def call(self, cmd: str, timeout: float = None) -> Any:
+        """
+        Queue a command and wait for its result
+        """
+        return self.submit(cmd).result(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "ok": self._thread is not None and self._thread.is_alive(),
+            "queued": self.queue.qsize(),
+            "coalesced": self.coalesced,
+        }
+
+    def _run(self):
+        while True:
+            _, _, job = self.queue.get()
+            if job is None:
+                break
+            with self._lock:
+                if job.key is not None:
+                    del self._queued[job.key]  # later commands start a new job
+                futures = [future for future in job.futures if future.set_running_or_notify_cancel()]
+                if not futures:
+                    continue
+                started = len(job.futures)
+                self._running = job
+            error = None
+            try:
+                result = job.handler(job.cmd)
+            except Exception as e:
+                self.logger.error(f"Serial worker error - {e.__str__()}")
+                error = e
+            with self._lock:
+                self._running = None
+                # callers that joined the running job (share_running)
+                futures += [future for future in job.futures[started:] if future.set_running_or_notify_cancel()]
+            for future in futures:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
@@ -0,0 +1,151 @@
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from metrics import registry
+from serial_transport import SerialTransport
+
+
+class SerialSupervisor:
+    """
+    Keeps the serial link to the Arduino open, independently of the socket server.
+    A background thread opens the link (open_link, including the boot handshake) and reopens it
+    when the read loop fails or restart() is called, with exponential backoff between failed attempts.
+    Meanwhile commands wait for the link (wait) instead of tearing the server down.
+
+    Args:
+        open_link: function opening the link (ex. open_arduino), raising on failure
+        on_connect: called with the new link after every (re)connection (ex. reset the actuator state)
+        backoff: seconds before the first retry
+        max_backoff: upper bound of the retry interval
+    """
+
+    def __init__(
+        self,
+        open_link: Callable[[], SerialTransport],
+        on_connect: Callable[[SerialTransport], None] = None,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        self.open_link = open_link
+        self.on_connect = on_connect
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.link: Optional[SerialTransport] = None
+        self.state = "starting"  # starting, up, reconnecting
+        self.restarts = 0
+        self.attempts = 0  # failed attempts since the link was lost
+        self.last_error = None
+        self.since = time.time()  # of the current state
+        self.downtime = 0.0  # total seconds without a link after the first connection
+        self._restart = threading.Event()
+        self._connected = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.logger = logging.getLogger("Server")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="SerialSupervisor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._restart.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.link is not None:
+            self.link.close()
+            self.link = None
+
+    def restart(self, reason: str):
+        """
+        Reopen the link (ex. after repeated timeouts); returns at once
+        """
+
+        if self.state == "up":
+            self.logger.error(f"Restart serial - {reason}")
+            self.last_error = reason
+            self._restart.set()
+
+    def wait(self, timeout: float) -> Optional[SerialTransport]:
+        """
+        The open link, waiting up to timeout seconds while it is being (re)opened
+
+        Returns:
+            link, or None when it is still down
+        """
+
+        deadline = time.time() + timeout
+        with self._connected:
+            # a failed link is replaced shortly (see _run)
+            while self.link is None or self.state != "up" or self.link.error is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0 or self._stop.is_set():
+                    return None
+                self._connected.wait(min(remaining, 0.1))
+            return self.link
+
+    def stats(self) -> dict:
+        return {
+            "ok": self.state == "up",
+            "state": self.state,
+            "port": self.link.name if self.link is not None else None,
+            "for": time.time() - self.since,
+            "restarts": self.restarts,
+            "attempts": self.attempts,
+            "downtime": self.downtime + (time.time() - self.since if self.state == "reconnecting" else 0),
+            "last_error": self.last_error,
+        }
+
+    def _set_state(self, state: str):
+        now = time.time()
+        if self.state == "reconnecting":
+            self.downtime += now - self.since
+        self.state = state
+        self.since = now
+
+    def _connect(self):
+        delay = self.backoff
+        while not self._stop.is_set():
+            try:
+                link = self.open_link()
+            except Exception as e:
+                self.attempts += 1
+                self.last_error = e.__str__()
+                self.logger.error(f"Serial open failed ({self.attempts}) - {e.__str__()}, retry in {delay:.0f} s")
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_backoff)
+                continue
+            if self.on_connect is not None:
+                self.on_connect(link)
+            with self._connected:
+                self.link = link
+                self._set_state("up")
+                self.attempts = 0
+                self._connected.notify_all()
+            return
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.link is None:
+                self._connect()
+                continue
+            # the read loop of SerialTransport records a failed port (ex. USB unplugged) in link.error
+            if not self._restart.wait(0.1) and self.link.error is None:
+                continue
+            if self._stop.is_set():
+                break
+            if self.link.error is not None:
+                self.last_error = self.link.error.__str__()
+            self._restart.clear()
+            with self._connected:
+                link, self.link = self.link, None
+                self._set_state("reconnecting")
+            link.close()
+            self.restarts += 1
+            registry.count("serial_restarts")
@@ -1,4 +1,5 @@
 import datetime
+import importlib
 import signal
 
 
@@ -43,4 +44,22 @@ def TimedInput(caption: str, default="no\n", timeout=5) -> str:
         return answer
     except TimeoutError:
         signal.signal(signal.SIGALRM, signal.SIG_IGN)
-        return default
\ No newline at end of file
+        return default
+
+
+class LazyModule:
+    """
+    Module imported on the first attribute access (ex. cv2.resize)
+
+    Args:
+        name: module name (ex. "pyrealsense2.pyrealsense2")
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
@@ -0,0 +1,293 @@
+"""
+Binary framing for the communication between Raspberry Pi and Server.
+The same file lives in raspberry_pi/ and server/; keep both copies identical (test/test_shared_modules.py).
+
+message = prefix | header | payload
+ - prefix: MAGIC (4 bytes), VERSION (uint8), header length (uint32), payload length (uint64), big endian
+ - header: utf-8 json object, "type" tells what the message is ("frame", "obs", "error", ...)
+ - payload: raw bytes described by the header
+
+A frame header carries every channel of the payload in order:
+    {"type": "frame", "timestamp": float, "shape": [H, W],
+     "channels": [{"name": "color", "dtype": "uint8", "shape": [H, W, 3], "encoding": "jpeg", "nbytes": int},
+                  {"name": "depth", "dtype": "uint16", "shape": [H, W], "encoding": "png", "nbytes": int}]}
+"""
+import importlib
+import importlib.util
+import json
+import socket
+import struct
+import zlib
+from typing import Dict, Tuple
+
+import numpy as np
+
+# opencv takes seconds to import on a Pi: it is only looked up here and imported on the first jpeg/png
+HAS_CV2 = importlib.util.find_spec("cv2") is not None  # server without opencv: raw / zlib / lz4 only
+_cv2 = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+MAGIC = b"RGBD"
+VERSION = 1
+PREFIX = struct.Struct("!4sBIQ")
+
+COLOR_ENCODINGS = ("raw", "jpeg", "png", "lz4")
+DEPTH_ENCODINGS = ("raw", "png", "zlib", "lz4")  # lossless only
+JPEG_QUALITY = 90
+
+
+def _opencv():
+    global _cv2
+    if _cv2 is None:
+        _cv2 = importlib.import_module("cv2")
+    return _cv2
+
+
+def supported_encodings() -> Dict[str, Tuple[str, ...]]:
+    """
+    Encodings available with the installed packages
+    """
+
+    available = {"raw", "zlib"}
+    if HAS_CV2:
+        available.update(("jpeg", "png"))
+    if lz4 is not None:
+        available.add("lz4")
+    return {
+        "color": tuple(e for e in COLOR_ENCODINGS if e in available),
+        "depth": tuple(e for e in DEPTH_ENCODINGS if e in available),
+    }
+
+
+def default_encoding() -> Dict[str, str]:
+    """
+    Smallest encodings available with the installed packages
+    """
+
+    if HAS_CV2:
+        return {"color": "jpeg", "depth": "png"}
+    return {"color": "lz4" if lz4 is not None else "raw", "depth": "lz4" if lz4 is not None else "zlib"}
+
+
+def pack_prefix(header_bytes: bytes, payload_length: int) -> bytes:
+    return PREFIX.pack(MAGIC, VERSION, len(header_bytes), payload_length)
+
+
+def unpack_prefix(prefix: bytes) -> Tuple[int, int]:
+    """
+    Returns:
+        header length, payload length
+
+    Raises:
+        ValueError: not a message of this protocol
+    """
+
+    magic, version, header_length, payload_length = PREFIX.unpack(prefix)
+    if magic != MAGIC:
+        raise ValueError(f"Unknown message magic {magic!r}")
+    if version > VERSION:
+        raise ValueError(f"Unsupported protocol version {version}")
+    return header_length, payload_length
+
+
+def enable_keepalive(sock: socket.socket, idle: int = 60, interval: int = 15, count: int = 4):
+    """
+    Let the OS detect dead peers of a long-lived connection
+    """
+
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, "TCP_KEEPIDLE"):  # linux
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+
+
+def pack_head(header: dict, payload_length: int = 0) -> bytes:
+    """
+    prefix + header of a message; the payload follows as is
+    """
+
+    header_bytes = json.dumps(header).encode()
+    return pack_prefix(header_bytes, payload_length) + header_bytes
+
+
+def send_message(sock: socket.socket, header: dict, payload: bytes = b""):
+    sock.sendall(pack_head(header, len(payload)))
+    if len(payload):
+        sock.sendall(payload)
+
+
+class RecvBuffer:
+    """
+    Reusable receive buffer; grows to the largest message and is never shrunk.
+    Views returned by view() (and arrays decoded from them without a copy) are overwritten by the next receive,
+    so keep one RecvBuffer per thread/connection and copy what must outlive it.
+    """
+
+    def __init__(self, size: int = 0):
+        self._buf = bytearray(size)
+
+    def view(self, count: int) -> memoryview:
+        if len(self._buf) < count:
+            self._buf = bytearray(count)
+        return memoryview(self._buf)[:count]
+
+
+def recv_into(sock: socket.socket, view: memoryview):
+    """
+    Fill view with data from sock, without intermediate bytes objects
+
+    Raises:
+        ConnectionError: the peer closed the connection
+    """
+
+    received = 0
+    count = len(view)
+    while received < count:
+        n = sock.recv_into(view[received:], count - received)
+        if not n:
+            raise ConnectionError("Connection closed by peer")
+        received += n
+
+
+def recv_exact(sock: socket.socket, count: int, buffer: RecvBuffer = None) -> memoryview:
+    """
+    Receive exactly count bytes
+
+    Args:
+        sock: socket.socket
+        count: the numbers of bytes
+        buffer: RecvBuffer to reuse; a new bytearray is allocated if None
+
+    Returns:
+        memoryview of the data; np.frombuffer(view, dtype) exposes it without a copy
+
+    Raises:
+        ConnectionError: the peer closed the connection
+    """
+
+    view = buffer.view(count) if buffer is not None else memoryview(bytearray(count))
+    recv_into(sock, view)
+    return view
+
+
+def recv_message(sock: socket.socket, buffer: RecvBuffer = None) -> Tuple[dict, memoryview]:
+    """
+    Receive one message
+
+    Args:
+        sock: socket.socket
+        buffer: RecvBuffer for the payload; a new bytearray is allocated if None
+
+    Returns:
+        header, payload
+
+    Raises:
+        ConnectionError: the peer closed the connection
+        ValueError: not a message of this protocol
+    """
+
+    header_length, payload_length = unpack_prefix(recv_exact(sock, PREFIX.size))
+    header = json.loads(bytes(recv_exact(sock, header_length)))
+    payload = recv_exact(sock, payload_length, buffer)
+    return header, payload
+
+
+def encode_array(array: np.ndarray, encoding: str) -> bytes:
+    if encoding == "raw":
+        return np.ascontiguousarray(array).tobytes()
+    if encoding == "zlib":
+        return zlib.compress(np.ascontiguousarray(array), 1)
+    if encoding == "lz4" and lz4 is not None:
+        return lz4.frame.compress(np.ascontiguousarray(array))
+    if encoding in ("jpeg", "png") and HAS_CV2:
+        cv2 = _opencv()
+        params = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY] if encoding == "jpeg" else [cv2.IMWRITE_PNG_COMPRESSION, 1]
+        ok, encoded = cv2.imencode("." + encoding.replace("jpeg", "jpg"), array, params)
+        if not ok:
+            raise ValueError(f"Failed to encode {encoding}")
+        return encoded.tobytes()
+    raise ValueError(f"{encoding} is not supported")
+
+
+def decode_array(data: bytes, meta: dict) -> np.ndarray:
+    encoding = meta["encoding"]
+    dtype = np.dtype(meta["dtype"])
+    shape = tuple(meta["shape"])
+    if encoding == "raw":
+        return np.frombuffer(data, dtype=dtype).reshape(shape)
+    if encoding == "zlib":
+        return np.frombuffer(zlib.decompress(data), dtype=dtype).reshape(shape)
+    if encoding == "lz4" and lz4 is not None:
+        return np.frombuffer(lz4.frame.decompress(data), dtype=dtype).reshape(shape)
+    if encoding in ("jpeg", "png") and HAS_CV2:
+        cv2 = _opencv()
+        array = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        return array.astype(dtype, copy=False).reshape(shape)
+    raise ValueError(f"{encoding} is not supported")
+
+
+def _pick(requested: str, supported: Tuple[str, ...], fallback: str) -> str:
+    return requested if requested in supported else fallback
+
+
+def encode_frame(
+    color: np.ndarray, depth: np.ndarray, encoding: Dict[str, str] = None, **extra
+) -> Tuple[dict, bytes]:
+    """
+    Encode color and depth as one frame message
+
+    Args:
+        color: (H, W, 3) uint8 BGR
+        depth: (H, W) uint16
+        encoding: {"color": one of COLOR_ENCODINGS, "depth": one of DEPTH_ENCODINGS}
+            unsupported encodings fall back to raw (color) and zlib (depth)
+        extra: additional header fields (ex. timestamp)
+
+    Returns:
+        header, payload
+    """
+
+    encoding = encoding or {}
+    supported = supported_encodings()
+    color = np.ascontiguousarray(color, dtype=np.uint8)
+    depth = np.ascontiguousarray(depth, dtype=np.uint16)
+    channels = []
+    blobs = []
+    for name, array, fallback in (("color", color, "raw"), ("depth", depth, "zlib")):
+        channel_encoding = _pick(encoding.get(name, fallback), supported[name], fallback)
+        blob = encode_array(array, channel_encoding)
+        channels.append({
+            "name": name,
+            "dtype": array.dtype.name,
+            "shape": list(array.shape),
+            "encoding": channel_encoding,
+            "nbytes": len(blob),
+        })
+        blobs.append(blob)
+    header = {"type": "frame", "shape": list(depth.shape[:2]), "channels": channels}
+    header.update(extra)
+    return header, b"".join(blobs)
+
+
+def decode_frame(header: dict, payload: bytes) -> Dict[str, np.ndarray]:
+    """
+    Decode the channels of a frame message.
+    Raw channels are views of payload (no copy).
+
+    Returns:
+        {channel name: ndarray} (ex. {"color": (H, W, 3) uint8, "depth": (H, W) uint16})
+    """
+
+    arrays = {}
+    offset = 0
+    view = memoryview(payload)
+    for meta in header["channels"]:
+        nbytes = meta["nbytes"]
+        arrays[meta["name"]] = decode_array(view[offset:offset + nbytes], meta)
+        offset += nbytes
+    return arrays
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import socket
+import time
+from typing import AsyncIterator, Callable, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+import wire
+from metrics import registry
+from socket_communications import (
+    CMD_REQUEST,
+    CMD_SENSING,
+    _decode_legacy_img,
+    _frame_from_reply,
+    _is_legacy,
+    _mark_legacy,
+    _sensing_request,
+    _warn_legacy_profile,
+    create_logger,
+)
+
+logger = create_logger("COLLECTOR")
+
+
+class Node(NamedTuple):
+    host: str
+    port: int
+    name: Optional[str] = None
+
+
+class SensingResult(NamedTuple):
+    """
+    node: polled node
+    img: (H, W, 4) - BGR + depth, uint16 (None if failed)
+    readings: sensor readings (see socket_communications.recv_sensing)
+    error: last error message (None if succeeded)
+    elapsed: seconds from the first attempt to the result
+    attempts: the number of attempts
+    """
+
+    node: Node
+    img: Optional[np.ndarray]
+    readings: Optional[list]
+    error: Optional[str]
+    elapsed: float
+    attempts: int
+
+
+async def _recv_into(sock: socket.socket, view: memoryview):
+    # wire.recv_into on a non-blocking socket
+    loop = asyncio.get_running_loop()
+    received = 0
+    while received < len(view):
+        n = await loop.sock_recv_into(sock, view[received:])
+        if not n:
+            raise asyncio.IncompleteReadError(bytes(view[:received]), len(view))
+        received += n
+    return view
+
+
+async def _recv_exact(sock: socket.socket, count: int, buffer: wire.RecvBuffer = None) -> memoryview:
+    return await _recv_into(sock, buffer.view(count) if buffer is not None else memoryview(bytearray(count)))
+
+
+async def _read_message(sock: socket.socket, buffer: wire.RecvBuffer = None):
+    # wire.recv_message; the payload is read into buffer (valid until its next use)
+    header_length, payload_length = wire.unpack_prefix(await _recv_exact(sock, wire.PREFIX.size))
+    try:
+        header = json.loads(bytes(await _recv_exact(sock, header_length)))
+        payload = await _recv_exact(sock, payload_length, buffer)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Connection closed by peer in a message")
+    return header, payload
+
+
+class Collector:
+    """ Poll sensing data of many Raspberry Pis in parallel (asyncio).
+
+    Args:
+        nodes (Iterable[Node or (host, port)]): Raspberry Pis to poll
+        concurrency (int, optional): the maximum number of nodes polled at once
+        timeout (float, optional): seconds per attempt of a node
+        retries (int, optional): extra attempts per node after a failure
+        retry_delay (float, optional): seconds between attempts
+        with_readings (bool, optional): also receive the sensor readings
+        encoding (dict, optional): {"color": str, "depth": str} (default: wire.default_encoding())
+        skip_unchanged (bool, optional): reuse the cached image when the Raspberry Pi reports no significant change
+        profile (str, optional): capture profile, ex. "preview" for frequent monitoring (default: the Pi's default)
+        cache (NodeCache, optional): also store every result in this cache (see node_cache.py)
+    """
+
+    def __init__(
+        self,
+        nodes: Iterable,
+        concurrency=8,
+        timeout=60,
+        retries=2,
+        retry_delay=1,
+        with_readings=True,
+        encoding=None,
+        skip_unchanged=True,
+        profile=None,
+        cache=None,
+    ):
+        self.nodes: List[Node] = [node if isinstance(node, Node) else Node(*node) for node in nodes]
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.with_readings = with_readings
+        self.encoding = encoding or wire.default_encoding()
+        self.skip_unchanged = skip_unchanged
+        self.profile = profile
+        self.cache = cache
+        self._buffers: List[wire.RecvBuffer] = []  # payload buffers of finished attempts, reused (one per attempt)
+
+    async def _sensing_wire(self, node, sock):
+        key = (node.host, node.port)
+        loop = asyncio.get_running_loop()
+        request = _sensing_request(key, self.with_readings, self.encoding, self.skip_unchanged, self.profile)
+        await loop.sock_sendall(sock, CMD_REQUEST.encode() + wire.pack_head(request))
+        buffer = self._buffers.pop() if self._buffers else wire.RecvBuffer()
+        header, payload = await _read_message(sock, buffer)
+        # decoding (jpeg/png) is cpu bound: keep the event loop free; the image is copied out of the buffer
+        img = await loop.run_in_executor(None, _frame_from_reply, key, header, payload, self.profile)
+        # reused only after a decode: the executor may still read the buffer of a cancelled attempt
+        self._buffers.append(buffer)
+        readings = header.get("readings")
+        if self.with_readings and "readings" not in header:  # Raspberry Pi without combined replies
+            header, _ = await _read_message(sock)
+            readings = header.get("readings")
+        return img, readings
+
+    async def _sensing_legacy(self, sock):
+        loop = asyncio.get_running_loop()
+        await loop.sock_sendall(sock, CMD_SENSING.encode())
+        # the image owns its bytearray: no buffer to reuse
+        img = _decode_legacy_img(await _recv_exact(sock, int(bytes(await _recv_exact(sock, 16)))))
+        readings = None
+        if self.with_readings:
+            readings = json.loads(bytes(await _recv_exact(sock, int(bytes(await _recv_exact(sock, 16))))))
+        return img, readings
+
+    async def _attempt(self, node: Node):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await asyncio.get_running_loop().sock_connect(sock, (node.host, node.port))
+            if _is_legacy((node.host, node.port)):
+                _warn_legacy_profile((node.host, node.port), self.profile)
+                return await self._sensing_legacy(sock)
+            try:
+                return await self._sensing_wire(node, sock)
+            except asyncio.IncompleteReadError as e:
+                if e.partial:
+                    raise
+        finally:
+            sock.close()
+        # closed without a reply: an old Raspberry Pi (on CMD_REQUEST), or a failed request of a current one
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, _mark_legacy, (node.host, node.port)):
+            raise ConnectionError("Connection closed by peer")
+        return await self._attempt(node)
+
+    async def poll_node(self, node: Node, semaphore: asyncio.Semaphore = None) -> SensingResult:
+        """
+        Poll one node with retries; never raises
+        """
+
+        semaphore = semaphore or asyncio.Semaphore(1)
+        start = time.time()
+        error = None
+        attempts = 0
+        async with semaphore:
+            while attempts <= self.retries:
+                if attempts:
+                    await asyncio.sleep(self.retry_delay)
+                attempts += 1
+                try:
+                    img, readings = await asyncio.wait_for(self._attempt(node), self.timeout)
+                    registry.observe(f"{node.host}:{node.port}/sensing", time.time() - start)
+                    if self.cache is not None:
+                        self.cache.update(node.host, node.port, img, readings, profile=self.profile)
+                    return SensingResult(node, img, readings, None, time.time() - start, attempts)
+                except asyncio.TimeoutError:
+                    error = f"timeout after {self.timeout} s"
+                    registry.count(f"{node.host}:{node.port}/timeouts")
+                except Exception as e:
+                    error = e.__str__() or type(e).__name__
+                    registry.count(f"{node.host}:{node.port}/errors")
+                logger.warning(f"{node.host}:{node.port} attempt {attempts} failed - {error}")
+        logger.error(f"{node.host}:{node.port} failed after {attempts} attempts")
+        registry.count(f"{node.host}:{node.port}/failures")
+        return SensingResult(node, None, None, error, time.time() - start, attempts)
+
+    async def poll(self) -> AsyncIterator[SensingResult]:
+        """
+        Poll every node once; results are yielded as they arrive
+
+        Example:
+            async for result in Collector(nodes).poll():
+                ...
+        """
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.ensure_future(self.poll_node(node, semaphore)) for node in self.nodes]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def run(self, callback: Callable[[SensingResult], None]) -> List[SensingResult]:
+        """
+        Blocking helper: poll every node once and call callback for each result as it arrives
+
+        Returns:
+            results in the order of arrival
+        """
+
+        async def _run():
+            results = []
+            async for result in self.poll():
+                callback(result)
+                results.append(result)
+            return results
+
+        return asyncio.run(_run())
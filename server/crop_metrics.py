@@ -0,0 +1,188 @@
+""" Batched crop metrics from RGB-D frames.
+
+Every function takes a stack of frames (N, H, W, ...) and is vectorized over the whole batch.
+Color is BGR uint8 as captured by the Raspberry Pi and depth is uint16 in depth units (1 mm on D400 by default).
+"""
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+
+DEPTH_SCALE = 0.001  # m per depth unit
+FX = FY = 615.0  # focal length in pixels, D400 color stream at 640x480 (use the device intrinsics if known)
+
+_EPS = 1e-6
+
+
+def split_rgbd(rgbd: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (N, H, W, 4) BGR + depth (as received by recv_img) -> color (N, H, W, 3) uint8, depth (N, H, W) uint16
+    """
+
+    return rgbd[..., :3].astype(np.uint8), rgbd[..., 3].astype(np.uint16)
+
+
+def color_indices(color: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Per-pixel vegetation indices from chromatic coordinates
+
+    Args:
+        color: (N, H, W, 3) BGR uint8
+
+    Returns:
+        {"exg": excess green 2g - r - b,
+         "gli": green leaf index (2G - R - B) / (2G + R + B),
+         "ngrdi": normalized green red difference (G - R) / (G + R),
+         "vari": visible atmospherically resistant index (G - R) / (G + R - B), clipped to [-1, 1]},
+        each (N, H, W) float32
+    """
+
+    bgr = color.astype(np.float32)
+    b, g, r = bgr[..., 0], bgr[..., 1], bgr[..., 2]
+    total = b + g + r + _EPS
+    return {
+        "exg": (2 * g - r - b) / total,
+        "gli": (2 * g - r - b) / (2 * g + r + b + _EPS),
+        "ngrdi": (g - r) / (g + r + _EPS),
+        "vari": np.clip((g - r) / np.where(np.abs(g + r - b) < _EPS, _EPS, g + r - b), -1, 1),
+    }
+
+
+def vegetation_mask(
+    color: np.ndarray,
+    depth: np.ndarray = None,
+    exg_threshold: float = 0.1,
+    depth_range: Tuple[float, float] = None,
+    indices: Dict[str, np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Plant pixels: excess green above the threshold (and depth inside depth_range if given)
+
+    Args:
+        color: (N, H, W, 3) BGR uint8
+        depth: (N, H, W) uint16
+        exg_threshold: threshold of the normalized excess green
+        depth_range: (near, far) in m; pixels without depth are excluded when given
+        indices: precomputed color_indices(color)
+
+    Returns:
+        (N, H, W) bool
+    """
+
+    if indices is None:
+        indices = color_indices(color)
+    mask = indices["exg"] > exg_threshold
+    if depth_range is not None and depth is not None:
+        z = depth * DEPTH_SCALE
+        mask &= (z > depth_range[0]) & (z < depth_range[1])
+    return mask
+
+
+def projected_leaf_area(
+    mask: np.ndarray, depth: np.ndarray, fx: float = FX, fy: float = FY, depth_scale: float = DEPTH_SCALE
+) -> np.ndarray:
+    """
+    Projected leaf area: sum over plant pixels of the footprint of a pixel at its depth, (z / fx) * (z / fy)
+
+    Returns:
+        (N,) m^2; pixels without depth do not count
+    """
+
+    z = depth.astype(np.float32) * depth_scale
+    return np.einsum("nhw,nhw->n", mask.astype(np.float32), z * z) / (fx * fy)
+
+
+def height_percentiles(
+    mask: np.ndarray,
+    depth: np.ndarray,
+    camera_height: float,
+    percentiles: Iterable[float] = (50, 90, 99),
+    depth_scale: float = DEPTH_SCALE,
+) -> np.ndarray:
+    """
+    Plant height percentiles, height = camera_height - depth of plant pixels
+
+    Args:
+        camera_height: height of the camera above the bed (m)
+
+    Returns:
+        (N, len(percentiles)) m; NaN for frames without plant pixels with depth
+    """
+
+    n = mask.shape[0]
+    height = camera_height - depth.reshape(n, -1).astype(np.float32) * depth_scale
+    valid = mask.reshape(n, -1) & (depth.reshape(n, -1) > 0)
+    height = np.where(valid, height, np.nan)
+    empty = ~valid.any(axis=1)
+    height[empty] = 0  # keep nanpercentile quiet; replaced below
+    result = np.nanpercentile(height, list(percentiles), axis=1).T
+    result[empty] = np.nan
+    return result
+
+
+def compute_metrics(
+    color: np.ndarray,
+    depth: np.ndarray,
+    camera_height: float = None,
+    exg_threshold: float = 0.1,
+    depth_range: Tuple[float, float] = None,
+    percentiles: Iterable[float] = (50, 90, 99),
+    fx: float = FX,
+    fy: float = FY,
+) -> Dict[str, np.ndarray]:
+    """
+    Per-frame crop metrics of a batch
+
+    Args:
+        color: (N, H, W, 3) BGR uint8
+        depth: (N, H, W) uint16
+        camera_height: height of the camera above the bed (m); no height metrics if None
+
+    Returns:
+        {"canopy_cover": (N,) fraction of plant pixels,
+         "leaf_area": (N,) projected leaf area (m^2),
+         "exg" / "gli" / "ngrdi" / "vari": (N,) mean index over plant pixels (NaN without plant pixels),
+         "height": (N, len(percentiles)) plant height percentiles (m)}
+    """
+
+    percentiles = list(percentiles)
+    indices = color_indices(color)
+    mask = vegetation_mask(color, depth, exg_threshold, depth_range, indices)
+    mask_f = mask.astype(np.float32)
+    pixels = mask_f.sum(axis=(1, 2))
+
+    metrics = {
+        "canopy_cover": pixels / mask[0].size,
+        "leaf_area": projected_leaf_area(mask, depth, fx, fy),
+    }
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for name, index in indices.items():
+            metrics[name] = np.einsum("nhw,nhw->n", mask_f, index) / pixels
+    if camera_height is not None:
+        metrics["height"] = height_percentiles(mask, depth, camera_height, percentiles)
+    return metrics
+
+
+def compute_metrics_chunked(
+    chunks: Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray]], batch_size: int = 64, **kwargs
+) -> Dict[str, np.ndarray]:
+    """
+    compute_metrics over a long sequence, batch_size frames at a time
+
+    Args:
+        chunks: (timestamps, color, depth) chunks, ex. FrameArchive.chunks() / FrameArchive.between()
+        kwargs: arguments of compute_metrics
+
+    Returns:
+        metrics of every frame with "timestamp" (N,)
+    """
+
+    results = []
+    for timestamps, color, depth in chunks:
+        for start in range(0, len(timestamps), batch_size):
+            stop = start + batch_size
+            metrics = compute_metrics(color[start:stop], depth[start:stop], **kwargs)
+            metrics["timestamp"] = np.asarray(timestamps[start:stop], dtype=np.float64)
+            results.append(metrics)
+    if not results:
+        return {}
+    return {name: np.concatenate([metrics[name] for metrics in results]) for name in results[0]}
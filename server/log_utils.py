@@ -0,0 +1,171 @@
+"""
+Logging setup for rasp_server and the collecting server.
+The same file lives in raspberry_pi/ and server/; keep both copies identical (test/test_shared_modules.py).
+
+Loggers only put records on a queue (QueueHandler); a listener thread formats and writes them, so a slow
+SD card never stalls the request path. The log file is rotated by size and at KST midnight, and rotated
+files are gzipped. The file is flushed when the queue runs empty, so a burst of records is one write.
+"""
+import atexit
+import datetime
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import time
+from typing import List, Optional
+
+KST = datetime.timezone(datetime.timedelta(hours=9))  # no daylight saving time in Korea
+FORMAT = "[%(asctime)s] - %(name)s - [%(levelname)s] - %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_last_time = (None, None)  # (second, struct_time) of the last converted record
+_listeners: List[logging.handlers.QueueListener] = []
+
+
+def kst_time(seconds: Optional[float] = None) -> time.struct_time:
+    """
+    logging.Formatter.converter in KST; records of the same second share one conversion
+
+    Args:
+        seconds: record.created (default: now)
+    """
+
+    global _last_time
+    second = int(time.time() if seconds is None else seconds)
+    cached_second, cached = _last_time
+    if second != cached_second:
+        cached = datetime.datetime.fromtimestamp(second, KST).timetuple()
+        _last_time = (second, cached)
+    return cached
+
+
+def _kst_day(seconds: float) -> datetime.date:
+    return datetime.datetime.fromtimestamp(seconds, KST).date()
+
+
+def _gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class RotatingGzipFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler that also rotates at KST midnight and gzips rotated files (log.txt.1.gz, ...).
+    flush() is left to sync() (see QueueListener), so records are not written one by one.
+
+    Args:
+        filename: log file
+        max_bytes: rotate when the file would exceed this size (0: never)
+        backup_count: rotated files kept
+        daily: rotate when the KST date changes
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 10 * 2 ** 20, backup_count: int = 10, daily: bool = True):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.daily = daily
+        self.namer = _gzip_namer
+        self.rotator = _gzip_rotator
+        self._day = _kst_day(time.time())
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.daily and _kst_day(record.created) != self._day:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self._day = _kst_day(time.time())
+
+    def flush(self):
+        pass
+
+    def sync(self):
+        super().flush()
+
+
+class QueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener that syncs RotatingGzipFileHandlers whenever the queue runs empty
+    """
+
+    def handle(self, record: logging.LogRecord):
+        super().handle(record)
+        if self.queue.empty():
+            for handler in self.handlers:
+                if isinstance(handler, RotatingGzipFileHandler):
+                    handler.acquire()
+                    try:
+                        handler.sync()
+                    finally:
+                        handler.release()
+
+
+def setup_logging(
+    logger_name: str,
+    file_dir: Optional[str] = None,
+    stream_level: int = logging.INFO,
+    file_level: int = logging.DEBUG,
+    max_bytes: int = 10 * 2 ** 20,
+    backup_count: int = 10,
+) -> logging.Logger:
+    """
+    Logger writing to the console and file_dir/log.txt through a queue
+
+    Args:
+        logger_name: ex. "Server", "COMM"
+        file_dir: directory of log.txt, created if needed (None: console only)
+        stream_level, file_level: levels of the console and the file
+        max_bytes, backup_count: see RotatingGzipFileHandler
+
+    Returns:
+        logger (the same one if it is already set up)
+    """
+
+    logger = logging.getLogger(logger_name)
+    logger.setLevel(logging.DEBUG)
+
+    # Check handler exists
+    if len(logger.handlers) > 0:
+        return logger  # Logger already exists
+
+    formatter = logging.Formatter(FORMAT, DATE_FORMAT)
+    formatter.converter = kst_time
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    stream_handler.setLevel(stream_level)
+    handlers = [stream_handler]
+
+    if file_dir is not None:
+        os.makedirs(file_dir, exist_ok=True)
+        file_handler = RotatingGzipFileHandler(os.path.join(file_dir, "log.txt"), max_bytes, backup_count)
+        file_handler.setFormatter(formatter)
+        file_handler.setLevel(file_level)
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return logger
+
+
+@atexit.register
+def stop_logging():
+    """
+    Write out the queued records and stop the listener threads (called at exit)
+    """
+
+    while _listeners:
+        listener = _listeners.pop()
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
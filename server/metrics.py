@@ -0,0 +1,165 @@
+"""
+Counters and latency histograms for rasp_server and the collecting server.
+The same file lives in raspberry_pi/ and server/; keep both copies identical (test/test_shared_modules.py).
+
+Histograms use fixed log-spaced buckets, so snapshots of many processes/nodes can be merged by adding counts
+and percentiles (p50, p99) are read from the buckets.
+"""
+import bisect
+import contextlib
+import threading
+import time
+from typing import Dict, Iterable, List
+
+# bucket upper bounds in seconds: 0.5 ms ... ~130 s, about 12 buckets per decade
+BOUNDS = [0.0005 * 1.2 ** i for i in range(70)]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)  # last bucket: above BOUNDS[-1]
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th percentile (0 < q <= 100); NaN when empty
+        """
+
+        if not self.count:
+            return float("nan")
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(BOUNDS[i], self.max) if i < len(BOUNDS) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "counts": list(self.counts),
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "mean": self.sum / self.count if self.count else float("nan"),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Histogram":
+        histogram = cls()
+        histogram.counts = list(data["counts"])
+        histogram.count = data["count"]
+        histogram.sum = data["sum"]
+        histogram.max = data["max"]
+        return histogram
+
+    def merge(self, other: "Histogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and histograms (seconds)
+
+    Example:
+        with registry.timer("capture"):
+            ...
+        registry.count("serial_retries")
+    """
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        """
+        json serializable state: {"uptime": s, "counters": {name: int}, "histograms": {name: Histogram.to_dict()}}
+        """
+
+        with self._lock:
+            return {
+                "uptime": time.time() - self.started,
+                "counters": dict(self.counters),
+                "histograms": {name: h.to_dict() for name, h in self.histograms.items()},
+            }
+
+    def merge_snapshot(self, snapshot: dict, prefix: str = ""):
+        """
+        Add the counters and histograms of a snapshot (ex. from another node), names prefixed with prefix
+        """
+
+        with self._lock:
+            for name, value in snapshot.get("counters", {}).items():
+                self.counters[prefix + name] = self.counters.get(prefix + name, 0) + value
+            for name, data in snapshot.get("histograms", {}).items():
+                if prefix + name not in self.histograms:
+                    self.histograms[prefix + name] = Histogram()
+                self.histograms[prefix + name].merge(Histogram.from_dict(data))
+
+    def replace_snapshot(self, snapshot: dict, prefix: str):
+        """
+        Set the counters and histograms of prefix to those of a snapshot, dropping the previous ones;
+        for cumulative snapshots pulled repeatedly from the same source (ex. a Raspberry Pi since its start)
+        """
+
+        with self._lock:
+            for names in (self.counters, self.histograms):
+                for name in [name for name in names if name.startswith(prefix)]:
+                    del names[name]
+            for name, value in snapshot.get("counters", {}).items():
+                self.counters[prefix + name] = value
+            for name, data in snapshot.get("histograms", {}).items():
+                self.histograms[prefix + name] = Histogram.from_dict(data)
+
+
+def summary(snapshot: dict, percentiles: Iterable[float] = (50, 99)) -> List[str]:
+    """
+    Human readable lines of a snapshot: "name: n=.., mean=.. ms, p50=.. ms, p99=.. ms" and counters
+    """
+
+    lines = []
+    for name, data in sorted(snapshot.get("histograms", {}).items()):
+        histogram = Histogram.from_dict(data)
+        values = ", ".join(f"p{q:g}={histogram.percentile(q) * 1000:.1f} ms" for q in percentiles)
+        mean = data["sum"] / data["count"] * 1000 if data["count"] else float("nan")
+        lines.append(f"{name}: n={data['count']}, mean={mean:.1f} ms, {values}")
+    for name, value in sorted(snapshot.get("counters", {}).items()):
+        lines.append(f"{name}: {value}")
+    return lines
+
+
+registry = Metrics()  # process wide registry
@@ -0,0 +1,211 @@
+import bisect
+import collections
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import registry
+from socket_communications import create_logger, recv_sensing
+
+logger = create_logger("CACHE")
+
+
+class CachedFrame:
+    """ Latest frame of a node and profile
+
+    Attributes:
+        img (ndarray): (H, W, 4) - BGR + depth, uint16 (shared, do not modify)
+        timestamp (float): capture time on the Raspberry Pi (time of receipt if unknown)
+        received (float): time.time() when the cache got it
+    """
+
+    __slots__ = ("img", "timestamp", "received")
+
+    def __init__(self, img, timestamp, received):
+        self.img = img
+        self.timestamp = timestamp
+        self.received = received
+
+
+class NodeCache:
+    """ Latest state of every Raspberry Pi in memory, so dashboards and control loops read without a round trip.
+
+    Per node, the cache holds the latest frame of every capture profile and a ring buffer of observations
+    (sensor readings) ordered by time. Observations older than ttl or beyond max_observations are evicted,
+    as are frames older than frame_ttl; frames beyond max_frames are evicted least recently updated first.
+
+    The cache is filled by update() (ex. Collector(cache=...)) or by get(), which asks the Raspberry Pi only when
+    the cached frame is older than max_age. Concurrent get() calls for the same node and profile share one request.
+
+    Args:
+        fetch (callable, optional): fetch(host, port, with_readings, profile) -> (img or -1, readings or None)
+            (default: socket_communications.recv_sensing)
+        ttl (float, optional): seconds an observation is kept after its receipt
+        max_observations (int, optional): observations kept per node
+        frame_ttl (float, optional): seconds a frame is kept
+        max_frames (int, optional): frames kept in total (about 2.4 MB each for 640 x 480)
+
+    Example:
+        cache = NodeCache()
+        img, readings = cache.get("192.168.10.21", 9999, max_age=10)  # at most one request per 10 s
+        cache.latest("192.168.10.21", 9999)["readings"]
+        cache.staleness()  # {("192.168.10.21", 9999): seconds since the last update}
+    """
+
+    def __init__(self, fetch=None, ttl=3600, max_observations=1000, frame_ttl=600, max_frames=64):
+        self.fetch = fetch or (
+            lambda host, port, with_readings, profile: recv_sensing(
+                host, port, with_readings=with_readings, profile=profile
+            )
+        )
+        self.ttl = ttl
+        self.max_observations = max_observations
+        self.frame_ttl = frame_ttl
+        self.max_frames = max_frames
+        self.frames = collections.OrderedDict()  # ((host, port), profile) -> CachedFrame, least recent first
+        self.observations = {}  # (host, port) -> deque of (timestamp, readings, received), oldest first
+        self.updated = {}  # (host, port) -> time.time() of the last update
+        self._pending = {}  # ((host, port), profile, with_readings) -> Future of the request in flight
+        self._lock = threading.Lock()
+
+    def update(self, host, port, img=None, readings=None, timestamp=None, profile=None):
+        """ Store a sensing result of a node
+
+        Args:
+            img (ndarray, optional): frame (None or -1: no frame)
+            readings (list, optional): [{"timestamp": float, "address": str, "values": list}, ...]
+            timestamp (float, optional): capture time (default: timestamp of the readings, or now)
+        """
+
+        now = time.time()
+        if timestamp is None:
+            timestamp = readings[0]["timestamp"] if readings else now
+        node = (host, port)
+        with self._lock:
+            self.updated[node] = now
+            if img is not None and not isinstance(img, int):
+                key = (node, profile)
+                self.frames[key] = CachedFrame(img, timestamp, now)
+                self.frames.move_to_end(key)
+                while len(self.frames) > self.max_frames:
+                    self.frames.popitem(last=False)
+            if readings is not None:
+                ring = self.observations.setdefault(node, collections.deque(maxlen=self.max_observations))
+                observation = (timestamp, readings, now)
+                if ring and timestamp < ring[-1][0]:  # out of order (ex. retried poll): keep the ring sorted
+                    items = list(ring)
+                    items.insert(bisect.bisect([item[0] for item in items], timestamp), observation)
+                    ring.clear()
+                    ring.extend(items[-self.max_observations:])
+                else:
+                    ring.append(observation)
+            self._evict(now)
+
+    def latest(self, host, port, profile=None):
+        """ Latest cached state of a node, without contacting it
+
+        Returns:
+            dict or None: {"img": ndarray or None, "frame_time": float or None,
+                "readings": list or None, "readings_time": float or None, "staleness": seconds since the last update}
+            None if nothing is cached for the node
+        """
+
+        node = (host, port)
+        with self._lock:
+            self._evict(time.time())
+            if node not in self.updated:
+                return None
+            frame = self.frames.get((node, profile))
+            ring = self.observations.get(node)
+            timestamp, readings, _ = ring[-1] if ring else (None, None, None)
+            return {
+                "img": frame.img if frame is not None else None,
+                "frame_time": frame.timestamp if frame is not None else None,
+                "readings": readings,
+                "readings_time": timestamp,
+                "staleness": time.time() - self.updated[node],
+            }
+
+    def range(self, host, port, start, end=None):
+        """ Cached observations of a node with start <= timestamp < end
+
+        Returns:
+            list: [(timestamp, readings), ...] oldest first
+        """
+
+        with self._lock:
+            self._evict(time.time())
+            ring = list(self.observations.get((host, port), ()))
+        timestamps = [timestamp for timestamp, _, _ in ring]
+        first = bisect.bisect_left(timestamps, start)
+        last = len(ring) if end is None else bisect.bisect_left(timestamps, end)
+        return [(timestamp, readings) for timestamp, readings, _ in ring[first:last]]
+
+    def staleness(self, host=None, port=None):
+        """ Seconds since the last update of a node, or of every node
+
+        Returns:
+            float or None (unknown node) if host and port are given, else {(host, port): float}
+        """
+
+        now = time.time()
+        with self._lock:
+            if host is not None:
+                updated = self.updated.get((host, port))
+                return None if updated is None else now - updated
+            return {node: now - updated for node, updated in self.updated.items()}
+
+    def get(self, host, port, max_age=0, with_readings=True, profile=None):
+        """ Cached frame and readings if younger than max_age, else fresh ones from the Raspberry Pi.
+        Callers asking for the same node and profile meanwhile wait for the same request (coalesced).
+
+        Args:
+            max_age (float, optional): seconds a cached frame (and readings if with_readings) stays fresh
+
+        Returns:
+            (ndarray or -1, list or None): as socket_communications.recv_sensing
+        """
+
+        node = (host, port)
+        now = time.time()
+        with self._lock:
+            frame = self.frames.get((node, profile))
+            ring = self.observations.get(node)
+            if frame is not None and now - frame.received <= max_age:
+                readings = ring[-1][1] if ring and ring[-1][0] >= frame.timestamp else None
+                if readings is not None or not with_readings:
+                    registry.count("cache/hits")
+                    return frame.img, readings
+            key = (node, profile, with_readings)
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = Future()
+        if not owner:
+            registry.count("cache/coalesced")
+            return pending.result()
+
+        registry.count("cache/misses")
+        result = (-1, None)
+        try:
+            img, readings = self.fetch(host, port, with_readings, profile)
+            if not isinstance(img, int):
+                self.update(host, port, img, readings, profile=profile)
+            result = (img, readings)
+        except Exception as e:
+            logger.warning(f"{host}:{port} fetch failed - {e}")
+        finally:
+            # also on KeyboardInterrupt and the like (raised here): the waiters get a failed result
+            with self._lock:
+                del self._pending[key]
+            pending.set_result(result)
+        return result
+
+    def _evict(self, now):
+        expired = [key for key, frame in self.frames.items() if now - frame.received > self.frame_ttl]
+        for key in expired:
+            del self.frames[key]
+        for ring in self.observations.values():
+            # by time of receipt: the clock of a Raspberry Pi may be off
+            while ring and now - ring[0][2] > self.ttl:
+                ring.popleft()
@@ -1,108 +1,743 @@
 import json
+import os
 import socket
+import threading
+import zlib
 import time
-import datetime
-import logging
-import pytz
 
 import numpy as np
 
+import wire
+from log_utils import kst_time, setup_logging
+from metrics import registry
+
+
+timetz = kst_time  # formatter converter (record time in KST)
 
-def timetz(*args):
-    tzinfo = pytz.timezone("Asia/Seoul")
-    return datetime.datetime.now(tzinfo).timetuple()
 
 def create_logger(logger_name, file_dir=None):
-    # Create Logger
-    logger = logging.getLogger(logger_name)
-    logger.setLevel(logging.DEBUG)
-
-    # Check handler exists
-    if len(logger.handlers) > 0:
-        return logger  # Logger already exists
-
-    formatter = logging.Formatter(
-        "[%(asctime)s] - %(name)s - [%(levelname)s] - %(message)s", "%Y-%m-%d %H:%M:%S"
-    )
-    formatter.converter = timetz
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(formatter)
-    stream_handler.setLevel(logging.INFO)
-    logger.addHandler(stream_handler)
-
-    if file_dir is not None:
-        file_handler = logging.FileHandler(f"{file_dir}/log.txt")
-        file_handler.setFormatter(formatter)
-        file_handler.setLevel(logging.DEBUG)
-        logger.addHandler(file_handler)
-
-    return logger
+    """ Logger writing to the console (INFO) and file_dir/log.txt (DEBUG) without blocking the caller
+    (see log_utils.setup_logging: queue, rotation, gzip of rotated files)
+    """
+
+    return setup_logging(logger_name, file_dir)
 
 logger = create_logger("COMM")
 
-# Receive data equal to the number of [count] from [socket]
+CMD_SENSING = "sensing"
+CMD_CONTROL = "control"
+CMD_REQUEST = "request"
+CMD_SESSION = "session"
+CMD_PING = "ping"
+CMD_SAMPLES = "samples"
+CMD_SYNC = "sync"
+CMD_METRICS = "metrics"
+CMD_STATUS = "status"
+LEGACY_SHAPE = (480, 640, 4)  # legacy sensing reply; the Raspberry Pi fits every camera to it (const.LEGACY_SHAPE)
+
+LEGACY_RECHECK = 600  # seconds until a Raspberry Pi marked legacy is probed again (ex. updated meanwhile)
+
+_legacy_peers = {}  # (host, port) -> time.time() a Raspberry Pi without the binary protocol was detected
+_frame_cache = {}  # ((host, port), profile) -> {frame id: img} of the last frames received, oldest first
+_frame_cache_lock = threading.Lock()  # requests of executor threads (ex. collector.py) update _frame_cache at once
+_FRAME_CACHE_SIZE = 4  # frames per node and profile; concurrent requests of a node refer to recent frames
+
+
+class LegacyPeerError(ConnectionError):
+    """The Raspberry Pi closed the connection on CMD_REQUEST"""
+
+
+class RemoteError(ValueError):
+    """The Raspberry Pi answered with an error message"""
+
+
+# Receive data equal to the number of [count] from [socket] into one preallocated bytearray
 def _recvall(socket, count):
-    buf = b""
-    while count:
-        newbuf = socket.recv(count)
-        if not newbuf:
-            return None
-        buf += newbuf
-        count -= len(newbuf)
+    buf = bytearray(count)
+    try:
+        wire.recv_into(socket, memoryview(buf))
+    except ConnectionError:
+        return None
     return buf
 
 
-def recv_img(host, port):
-    """ Receive images using socket communication.
+_buffers = threading.local()
+
+
+def _recv_buffer():
+    # one reusable payload buffer per thread; decoded frames are copied out of it
+    if not hasattr(_buffers, "payload"):
+        _buffers.payload = wire.RecvBuffer()
+    return _buffers.payload
+
+
+def _is_legacy(node):
+    marked = _legacy_peers.get(node)
+    if marked is not None and time.time() - marked > LEGACY_RECHECK:
+        _legacy_peers.pop(node, None)
+        return False
+    return marked is not None
+
+
+def _mark_legacy(node):
+    # A closed connection without a reply is no proof of an old Raspberry Pi (a current one may have failed):
+    # it is marked legacy only if it also closes on a ping over a new connection.
+    try:
+        sock = socket.create_connection(node, timeout=15)
+    except OSError:
+        return False
+    try:
+        sock.sendall(CMD_REQUEST.encode())
+        wire.send_message(sock, {"cmd": CMD_PING})
+        wire.recv_message(sock)
+        legacy = False
+    except ConnectionError:
+        legacy = True
+    except (OSError, ValueError):
+        legacy = False
+    finally:
+        sock.close()
+    if legacy:
+        logger.info(f"{node[0]}:{node[1]} does not support the binary protocol")
+        _legacy_peers[node] = time.time()
+    return legacy
+
+
+def _warn_legacy_profile(node, profile):
+    if profile is not None:
+        logger.warning(f"{node[0]}:{node[1]} only speaks the legacy protocol: profile {profile} ignored {LEGACY_SHAPE}")
+
+
+def _decode_legacy_img(data):
+    # uint16 LEGACY_SHAPE image of the legacy sensing reply; no copy, the image shares the memory of data
+    return np.frombuffer(data, dtype="uint16").reshape(LEGACY_SHAPE)
+
+
+def _recv_sensing_legacy(client_socket, with_readings):
+    # 16 bytes length + uint16 (480, 640, 4) image, then 16 bytes length + json readings
+    client_socket.sendall(CMD_SENSING.encode())
+    img_length = _recvall(client_socket, 16)
+    img = _decode_legacy_img(_recvall(client_socket, int(img_length)))  # img owns the bytearray
+    logger.debug("recv img")
+
+    readings = None
+    if with_readings:
+        # the Raspberry Pi sends the readings after the image (SDI-12 scan takes a while)
+        client_socket.settimeout(45)
+        try:
+            obs_length = _recvall(client_socket, 16)
+            readings = json.loads(_recvall(client_socket, int(obs_length)))
+            logger.debug("recv obs")
+        except Exception as e:
+            logger.error(f"recv obs failed - {e}")
+    return img, readings
+
+
+def _sensing_request(node, with_readings, encoding, skip_unchanged=True, profile=None):
+    # combined: the readings come in the frame header, so the Raspberry Pi reads the sensors while encoding
+    request = {"cmd": CMD_SENSING, "encoding": encoding, "readings": with_readings, "combined": True}
+    if profile is not None:
+        request["profile"] = profile
+    with _frame_cache_lock:
+        frames = _frame_cache.get((node, profile))
+        if skip_unchanged and frames:
+            request["since"] = next(reversed(frames))
+    return request
+
+
+def _frame_from_reply(node, header, payload, profile=None):
+    # frame message -> img (cached by node and profile unless node is None), "unchanged" message -> cached img
+    if header["type"] == "error":
+        raise RemoteError(header["message"])
+    if header["type"] == "unchanged":
+        with _frame_cache_lock:
+            cached = _frame_cache.get((node, profile), {}).get(header["frame_id"])
+        if cached is None:
+            raise RemoteError(f"unchanged reply for a frame not in cache ({header['frame_id']})")
+        logger.debug(f"img unchanged (color {header['color_diff']:.3f}, depth {header['depth_diff']:.1f})")
+        return cached
+    arrays = wire.decode_frame(header, payload)
+    img = np.concatenate((arrays["color"], arrays["depth"][..., None]), axis=-1)
+    if node is not None and "frame_id" in header:  # not the archived frames of samples (recv_samples, sync)
+        with _frame_cache_lock:
+            frames = _frame_cache.setdefault((node, profile), {})
+            frames.pop(header["frame_id"], None)
+            frames[header["frame_id"]] = img
+            while len(frames) > _FRAME_CACHE_SIZE:
+                frames.pop(next(iter(frames)))
+    logger.debug(f"recv img {header['shape']} ({len(payload)} bytes)")
+    return img
+
+
+def _recv_frame(client_socket, node=None, profile=None):
+    # -> img, header (header["readings"] for combined replies)
+    header, payload = wire.recv_message(client_socket, _recv_buffer())
+    return _frame_from_reply(node, header, payload, profile), header
+
+
+def _recv_obs(client_socket):
+    header, _ = wire.recv_message(client_socket)
+    if header["type"] == "error":
+        raise RemoteError(header["message"])
+    logger.debug("recv obs")
+    return header.get("readings")
+
+
+def _recv_sensing_wire(client_socket, node, with_readings, encoding, skip_unchanged, profile=None):
+    # CMD_REQUEST + request message, then frame (or "unchanged") message with the readings (see wire.py);
+    # Raspberry Pis without combined replies send the readings in an obs message after the frame
+    if with_readings:
+        client_socket.settimeout(45)  # the reply waits for the SDI-12 scan
+    try:
+        client_socket.sendall(CMD_REQUEST.encode())
+        wire.send_message(client_socket, _sensing_request(node, with_readings, encoding, skip_unchanged, profile))
+        closed = not client_socket.recv(1, socket.MSG_PEEK)
+    except ConnectionError as e:
+        raise LegacyPeerError(e.__str__())
+    if closed:
+        # an old Raspberry Pi closes the connection on CMD_REQUEST
+        raise LegacyPeerError("Connection closed by peer")
+    img, header = _recv_frame(client_socket, node, profile)
+
+    readings = header.get("readings")
+    if with_readings and "readings" not in header:
+        try:
+            readings = _recv_obs(client_socket)
+        except Exception as e:
+            logger.error(f"recv obs failed - {e}")
+    return img, readings
+
+
+def recv_sensing(host, port, with_readings=True, encoding=None, skip_unchanged=True, profile=None):
+    """ Receive images and sensor readings using socket communication.
+    The binary protocol of wire.py is used unless the Raspberry Pi only speaks the legacy protocol.
 
     Args:
         host (str, optional): DDNS address of Raspberry Pi. 
         port (int, optional): Port opened
+        with_readings (bool, optional): if False, close after the image without waiting for readings
+        encoding (dict, optional): {"color": str, "depth": str} (default: wire.default_encoding())
+        skip_unchanged (bool, optional): let the Raspberry Pi skip a frame nearly identical to the cached one
+        profile (str, optional): capture profile of the Raspberry Pi, ex. "preview", "full" (default: its default)
+            The legacy protocol has no profiles: ignored with a warning, frames are (480, 640, 4).
 
     Returns:
-        ndarray or -1:
-            Current images (480, 640, 4).
-            if recv failed, img = -1
+        (ndarray or -1, list or None):
+            Current images (H, W, 4) - BGR + depth, uint16.
+            When the Raspberry Pi reports no significant change, the cached image (shared, do not modify).
+            Sensor readings [{"timestamp": float, "address": str, "values": [float or None, ...]}, ...],
+            timestamp: capture time of the image
+            if recv failed, img = -1 and readings = None
     """
-    
-    #NOTE: After finishing connect all sensors, add receiving sensor data from Raspberry Pi
 
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    client_socket.settimeout(15)
+    if encoding is None:
+        encoding = wire.default_encoding()
 
     retry = 1
     error = 0
+    img = -1
+    readings = None
+    node = f"{host}:{port}"
+    start = time.perf_counter()
 
     while retry:
         msg = f"{error} error"
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client_socket.settimeout(15)
         try:
             client_socket.connect((host, port))
             msg = "connected to Raspberry Pi 3B+"
             logger.debug(msg)
 
-            client_socket.sendall("sensing".encode())
-            msg = "send `get_sensing_data` signal"
-            logger.debug(msg)
-
-            img_length = _recvall(client_socket, 16)
-            img = _recvall(client_socket, int(img_length))
-            msg = "recv img"
-            logger.debug(msg)
-
-            img = np.frombuffer(img, dtype="uint16").reshape(480, 640, 4)
-            msg = "convert img"
+            if _is_legacy((host, port)):
+                _warn_legacy_profile((host, port), profile)
+                img, readings = _recv_sensing_legacy(client_socket, with_readings)
+            else:
+                try:
+                    img, readings = _recv_sensing_wire(
+                        client_socket, (host, port), with_readings, encoding, skip_unchanged, profile
+                    )
+                except LegacyPeerError:
+                    client_socket.close()
+                    if not _mark_legacy((host, port)):
+                        raise  # a failed request of a current Raspberry Pi: retried
+                    continue
+            msg = "recv sensing data"
             logger.debug(msg)
             retry = 0
 
         except Exception as e:
             logger.warning(e)
+            registry.count(f"{node}/timeouts" if isinstance(e, socket.timeout) else f"{node}/errors")
             if error > 2:
                 logger.error(f"recv failed after {msg}")
-                img = -1
+                registry.count(f"{node}/failures")
                 retry = 0
             else:
                 error += 1
+                registry.count(f"{node}/retries")
                 time.sleep(1)
 
-    client_socket.close()
-    return img
\ No newline at end of file
+        finally:
+            client_socket.close()
+
+    if retry == 0 and not isinstance(img, int):
+        registry.observe(f"{node}/sensing", time.perf_counter() - start)
+    return img, readings
+
+
+def _recv_samples(client_socket, frames):
+    # samples message, then one frame (or "missing") message per record if frames
+    header, _ = wire.recv_message(client_socket)
+    if header["type"] == "error":
+        raise RemoteError(header["message"])
+    images = {}
+    if frames:
+        for _ in header["records"]:
+            frame_header, payload = wire.recv_message(client_socket, _recv_buffer())
+            if frame_header["type"] == "missing":
+                continue
+            images[frame_header["frame_id"]] = _frame_from_reply(None, frame_header, payload)
+    return header["records"], images, header["cursor"]
+
+
+def recv_samples(host, port, cursor=0, limit=100, frames=False, latest=False, encoding=None):
+    """ Receive samples captured on schedule by the Raspberry Pi (see rasp_server.take_sample)
+
+    Args:
+        host (str): DDNS address of Raspberry Pi.
+        port (int): Port opened
+        cursor (int, optional): key of the last sample already received (0: from the beginning)
+        limit (int, optional): the maximum number of samples
+        frames (bool, optional): also receive the archived frames
+        latest (bool, optional): only the latest sample (cursor and limit are ignored)
+        encoding (dict, optional): {"color": str, "depth": str} of the frames (default: wire.default_encoding())
+
+    Returns:
+        (list, dict, int):
+            sample records [{"key": int, "frame": float, "shape": [H, W], "readings": list or None}, ...]
+                ("missing": true when the Raspberry Pi dropped the frame of the sample)
+            images {frame id: (H, W, 4) BGR + depth, uint16} of the archived frames
+            cursor for the next call
+    """
+
+    request = {
+        "cmd": CMD_SAMPLES,
+        "cursor": cursor,
+        "limit": limit,
+        "frames": frames,
+        "latest": latest,
+        "encoding": encoding or wire.default_encoding(),
+    }
+    with socket.create_connection((host, port), timeout=15) as client_socket:
+        client_socket.sendall(CMD_REQUEST.encode())
+        wire.send_message(client_socket, request)
+        return _recv_samples(client_socket, frames)
+
+
+def _load_cursors(state_path):
+    if state_path is not None and os.path.exists(state_path):
+        with open(state_path) as f:
+            return json.load(f)
+    return {}
+
+
+def _save_cursors(state_path, cursors):
+    if state_path is None:
+        return
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cursors, f)
+    os.replace(tmp_path, state_path)  # atomic: a crash never leaves a broken state file
+
+
+def sync(
+    host,
+    port,
+    on_records,
+    on_frame=None,
+    cursors=None,
+    state_path=None,
+    kinds=None,
+    encoding=None,
+    retries=5,
+):
+    """ Pull every record stored on the Raspberry Pi since the cursors as one stream (CMD_SYNC).
+    The cursor of a kind advances only after a chunk and its frames were handed to the callbacks,
+    so an interrupted sync resumes where it stopped (also across runs with state_path).
+
+    Args:
+        host (str): DDNS address of Raspberry Pi.
+        port (int): Port opened
+        on_records (callable): on_records(kind, records) for every chunk of records, in key order
+        on_frame (callable, optional): on_frame(frame id, img) for the frames of sample records (None: no frames)
+        cursors (dict, optional): {kind: key of the last record already received} (default: from state_path or 0)
+        state_path (str, optional): json file where the cursors are kept between chunks and runs
+        kinds (list, optional): kinds to sync, ex. ["sample", "act"] (default: every kind)
+        encoding (dict, optional): {"color": str, "depth": str} of the frames (default: wire.default_encoding())
+        retries (int, optional): reconnections after a failure
+
+    Returns:
+        dict: cursors after the sync
+    """
+
+    cursors = dict(cursors) if cursors is not None else _load_cursors(state_path)
+    request = {
+        "cmd": CMD_SYNC,
+        "kinds": kinds,
+        "frames": on_frame is not None,
+        "encoding": encoding or wire.default_encoding(),
+    }
+    error = 0
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=60) as client_socket:
+                client_socket.sendall(CMD_REQUEST.encode())
+                wire.send_message(client_socket, {**request, "cursors": cursors})
+                while True:
+                    header, payload = wire.recv_message(client_socket)
+                    if header["type"] == "error":
+                        raise RemoteError(header["message"])
+                    if header["type"] == "end":
+                        logger.info(f"sync {host}:{port} done - {header['cursors']}")
+                        return cursors
+                    lines = zlib.decompress(payload).decode().split("\n")
+                    records = [json.loads(line) for line in lines]
+                    for _ in range(header["frames"]):
+                        frame_header, frame_payload = wire.recv_message(client_socket, _recv_buffer())
+                        if frame_header["type"] != "missing":
+                            on_frame(frame_header["frame_id"], _frame_from_reply(None, frame_header, frame_payload))
+                    on_records(header["kind"], records)
+                    cursors[header["kind"]] = header["cursor"]
+                    _save_cursors(state_path, cursors)
+                    logger.debug(f"sync {header['kind']} {header['count']} records")
+
+        except RemoteError:
+            raise
+        except Exception as e:
+            if error >= retries:
+                logger.error(f"sync {host}:{port} failed - {e}")
+                raise
+            error += 1
+            logger.warning(f"sync {host}:{port} interrupted - {e}, resuming from {cursors}")
+            time.sleep(1)
+
+
+def recv_metrics(host, port, merge=True):
+    """ Latency histograms and counters of a Raspberry Pi (see metrics.py)
+
+    Args:
+        host (str): DDNS address of Raspberry Pi.
+        port (int): Port opened
+        merge (bool, optional): also keep them in the local registry, prefixed with "host:port/pi/"
+            (replacing the previous pull: the snapshot of the Raspberry Pi is cumulative since its start)
+
+    Returns:
+        dict: metrics snapshot, with the "frame_writer" statistics of the Raspberry Pi
+    """
+
+    with socket.create_connection((host, port), timeout=15) as client_socket:
+        client_socket.sendall(CMD_REQUEST.encode())
+        wire.send_message(client_socket, {"cmd": CMD_METRICS})
+        header, _ = wire.recv_message(client_socket)
+    if header["type"] == "error":
+        raise RemoteError(header["message"])
+    if merge:
+        registry.replace_snapshot(header["metrics"], f"{host}:{port}/pi/")
+    return header["metrics"]
+
+
+def recv_status(host, port):
+    """ Health of the components of a Raspberry Pi: serial link, camera, workers
+
+    Args:
+        host (str): DDNS address of Raspberry Pi.
+        port (int): Port opened
+
+    Returns:
+        dict: {"ok": bool, "uptime": seconds, "components": {name: {"ok": bool, ...}}}
+    """
+
+    with socket.create_connection((host, port), timeout=15) as client_socket:
+        client_socket.sendall(CMD_REQUEST.encode())
+        wire.send_message(client_socket, {"cmd": CMD_STATUS})
+        header, _ = wire.recv_message(client_socket)
+    if header["type"] == "error":
+        raise RemoteError(header["message"])
+    return header
+
+
+def recv_img(host, port, profile=None):
+    """ Receive images using socket communication.
+
+    Args:
+        host (str, optional): DDNS address of Raspberry Pi. 
+        port (int, optional): Port opened
+        profile (str, optional): capture profile (see recv_sensing)
+
+    Returns:
+        ndarray or -1:
+            Current images (H, W, 4), (480, 640, 4) by default.
+            if recv failed, img = -1
+    """
+
+    return recv_sensing(host, port, with_readings=False, profile=profile)[0]
+
+
+class NodeSession:
+    """ Persistent connection to one Raspberry Pi (CMD_SESSION).
+    One connection carries many request-response pairs; call ping() to keep it alive while idle.
+
+    Args:
+        host (str): DDNS address of Raspberry Pi.
+        port (int): Port opened
+        timeout (float, optional): socket timeout per response
+    """
+
+    def __init__(self, host, port, timeout=45):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.last_used = 0
+        self.lock = threading.Lock()  # one request-response pair at a time
+        self.sock = None
+
+    def connect(self):
+        self.close()
+        sock = socket.create_connection((self.host, self.port), timeout=15)
+        wire.enable_keepalive(sock)
+        try:
+            sock.sendall(CMD_SESSION.encode())
+            wire.send_message(sock, {"cmd": CMD_PING})
+            header, _ = wire.recv_message(sock)
+        except ConnectionError as e:
+            sock.close()
+            raise LegacyPeerError(e.__str__())
+        if header["type"] != "pong":
+            sock.close()
+            raise ValueError(f"Unexpected reply {header}")
+        sock.settimeout(self.timeout)
+        self.sock = sock
+        self.last_used = time.time()
+        logger.debug(f"session opened {self.host}:{self.port}")
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                wire.send_message(self.sock, {"cmd": "close"})
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
+
+    def sensing(self, with_readings=True, encoding=None, skip_unchanged=True, profile=None):
+        """
+        Returns:
+            (ndarray, list or None): images (H, W, 4) and sensor readings (see recv_sensing)
+        """
+
+        if encoding is None:
+            encoding = wire.default_encoding()
+        node = (self.host, self.port)
+        start = time.perf_counter()
+        with self.lock:
+            if self.sock is None:
+                self.connect()
+            wire.send_message(self.sock, _sensing_request(node, with_readings, encoding, skip_unchanged, profile))
+            img, header = _recv_frame(self.sock, node, profile)
+            readings = header.get("readings")
+            if with_readings and "readings" not in header:
+                readings = _recv_obs(self.sock)
+            self.last_used = time.time()
+        registry.observe(f"{self.host}:{self.port}/sensing", time.perf_counter() - start)
+        return img, readings
+
+    def samples(self, cursor=0, limit=100, frames=False, latest=False, encoding=None):
+        """ recv_samples() over the session
+
+        Returns:
+            (list, dict, int): records, images, cursor (see recv_samples)
+        """
+
+        request = {
+            "cmd": CMD_SAMPLES,
+            "cursor": cursor,
+            "limit": limit,
+            "frames": frames,
+            "latest": latest,
+            "encoding": encoding or wire.default_encoding(),
+        }
+        with self.lock:
+            if self.sock is None:
+                self.connect()
+            wire.send_message(self.sock, request)
+            result = _recv_samples(self.sock, frames)
+            self.last_used = time.time()
+        return result
+
+    def control(self, pump=None, **actuators):
+        """ Change actuators of the Raspberry Pi; setpoints not given are kept.
+        Control commands go before queued sensing on the Pi, and commands queued meanwhile are coalesced.
+
+        Args:
+            pump (int): activation time of the pump (0 - 300)
+            actuators: temperature, humidity (setpoints), fan, led (0 - 255); see raspberry_pi/const.py ACTUATORS
+
+        Returns:
+            dict: acknowledgement; "command" sent to the Arduino, "state" (setpoints), "sent" (False for duplicates),
+                "queued" and "ack" (seconds waiting for the serial link and on it), "coalesced" (other requests merged)
+        """
+
+        if pump is not None:
+            actuators["pump"] = int(pump)
+        start = time.perf_counter()
+        ack = self.request({"cmd": CMD_CONTROL, "actuators": actuators})
+        registry.observe(f"{self.host}:{self.port}/control", time.perf_counter() - start)
+        return ack
+
+    def ping(self):
+        return self.request({"cmd": CMD_PING})
+
+    def metrics(self):
+        """
+        Returns:
+            dict: metrics snapshot of the Raspberry Pi (see recv_metrics)
+        """
+
+        return self.request({"cmd": CMD_METRICS})["metrics"]
+
+    def status(self):
+        """
+        Returns:
+            dict: health of the Raspberry Pi (see recv_status)
+        """
+
+        return self.request({"cmd": CMD_STATUS})
+
+    def request(self, request):
+        """ Send a request with a single reply message (control, ping, ...)
+
+        Returns:
+            dict: reply header
+
+        Raises:
+            RemoteError: the Raspberry Pi answered with an error
+        """
+
+        with self.lock:
+            if self.sock is None:
+                self.connect()
+            wire.send_message(self.sock, request)
+            header, _ = wire.recv_message(self.sock)
+            self.last_used = time.time()
+        if header["type"] == "error":
+            raise RemoteError(header["message"])
+        return header
+
+
+class SessionPool:
+    """ NodeSession per (host, port), reconnected transparently when a request fails.
+    A heartbeat thread pings sessions idle for more than heartbeat seconds.
+
+    Args:
+        heartbeat (float, optional): seconds; must be shorter than SESSION_IDLE_TIMEOUT of the Raspberry Pi
+        retries (int, optional): reconnections per request
+    """
+
+    def __init__(self, heartbeat=30, retries=2):
+        self.heartbeat = heartbeat
+        self.retries = retries
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat_loop, name="SessionHeartbeat", daemon=True)
+        self._thread.start()
+
+    def get(self, host, port):
+        with self._lock:
+            session = self.sessions.get((host, port))
+            if session is None:
+                session = self.sessions[(host, port)] = NodeSession(host, port)
+            return session
+
+    def _call(self, host, port, func, retries=None):
+        session = self.get(host, port)
+        retries = self.retries if retries is None else retries
+        error = 0
+        while True:
+            try:
+                return func(session)
+            except (OSError, ValueError) as e:
+                if isinstance(e, LegacyPeerError) and _mark_legacy((host, port)):
+                    raise
+                if isinstance(e, RemoteError):
+                    raise
+                # the stream state is unknown after a failure: reconnect
+                with session.lock:
+                    session.close()
+                if error >= retries:
+                    raise
+                logger.warning(f"session {host}:{port} failed - {e}, reconnecting")
+                registry.count(f"{host}:{port}/reconnects")
+                error += 1
+
+    def sensing(self, host, port, with_readings=True, encoding=None, skip_unchanged=True, profile=None):
+        """ Like recv_sensing(), over the pooled session; falls back to recv_sensing() for old Raspberry Pis
+        (without profiles: a warning is logged if one is requested)
+
+        Returns:
+            (ndarray or -1, list or None)
+        """
+
+        if _is_legacy((host, port)):
+            return recv_sensing(host, port, with_readings, encoding, profile=profile)
+        try:
+            return self._call(
+                host, port, lambda session: session.sensing(with_readings, encoding, skip_unchanged, profile)
+            )
+        except LegacyPeerError as e:
+            if not _is_legacy((host, port)):  # marked by _call
+                logger.error(f"session sensing failed - {e}")
+                return -1, None
+            return recv_sensing(host, port, with_readings, encoding, profile=profile)
+        except Exception as e:
+            logger.error(f"session sensing failed - {e}")
+            return -1, None
+
+    def control(self, host, port, pump=None, **actuators):
+        """ NodeSession.control() over the pooled session.
+        Only the connection is retried (checked with a ping): once sent, a failed control request (ex. timeout)
+        is raised, not sent again, since the Raspberry Pi may have executed it (ex. the pump would run twice).
+
+        Raises:
+            OSError, ValueError: the control request failed; the actuators may or may not have changed
+        """
+
+        self._call(host, port, lambda session: session.ping())
+        return self._call(host, port, lambda session: session.control(pump, **actuators), retries=0)
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            with session.lock:
+                session.close()
+
+    def _heartbeat_loop(self):
+        while not self._closed.wait(self.heartbeat / 2):
+            with self._lock:
+                sessions = list(self.sessions.values())
+            for session in sessions:
+                if session.sock is None or time.time() - session.last_used < self.heartbeat:
+                    continue
+                if not session.lock.acquire(blocking=False):
+                    continue  # busy, so not idle
+                session.lock.release()
+                try:
+                    session.ping()
+                except Exception as e:
+                    logger.warning(f"heartbeat {session.host}:{session.port} failed - {e}")
+                    with session.lock:
+                        session.close()
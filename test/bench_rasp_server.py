@@ -0,0 +1,277 @@
+"""
+End-to-end benchmark of rasp_server without hardware
+
+rasp_server.py runs as a subprocess on a simulated camera (fakes/pyrealsense2) and a simulated Arduino
+(fake_arduino.py), and many concurrent clients (socket_communications.py) measure the throughput and
+latency of sensing and control requests. The metrics of the Pi (metrics command) are printed as well.
+
+Example:
+    python test/bench_rasp_server.py --clients 8 --duration 30 --json result.json
+    python test/bench_rasp_server.py --clients 8 --duration 30 --baseline result.json  # exit 1 on regression
+    # slow SDI-12 scans: concurrent requests share one scan, request.sensing stays near serial_sensing (~4 s)
+    python test/bench_rasp_server.py --clients 6 --latency 4 --duration 30
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "server"), os.path.dirname(os.path.abspath(__file__))]
+
+import socket_communications as sc  # noqa: E402
+from fake_arduino import FakeArduino  # noqa: E402
+from metrics import Histogram, summary  # noqa: E402
+
+
+class Op:
+    """
+    Results of one kind of request
+    """
+
+    def __init__(self):
+        self.histogram = Histogram()
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool):
+        with self._lock:
+            if ok:
+                self.histogram.observe(seconds)
+            else:
+                self.errors += 1
+
+    def result(self, elapsed: float) -> dict:
+        histogram = self.histogram
+        return {
+            "ok": histogram.count,
+            "errors": self.errors,
+            "throughput": histogram.count / elapsed,
+            "mean": histogram.sum / histogram.count if histogram.count else float("nan"),
+            "p50": histogram.percentile(50),
+            "p90": histogram.percentile(90),
+            "p99": histogram.percentile(99),
+            "max": histogram.max,
+        }
+
+
+def start_pi(args, port: str, workdir: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.join(ROOT, "test", "fakes"), os.path.join(ROOT, "raspberry_pi"), env.get("PYTHONPATH", "")]
+    )
+    env["FAKE_REALSENSE_FPS"] = str(args.fps)
+    env["FAKE_REALSENSE_MOTION"] = str(args.motion)
+    command = [
+        sys.executable, os.path.join(ROOT, "raspberry_pi", "rasp_server.py"),
+        "-p", str(args.port), "--usb", port, "--host", "127.0.0.1",
+    ]
+    if not args.persist:
+        command.append("-d")
+    log = open(os.path.join(workdir, "rasp_server.log"), "w")
+    return subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(args, process: subprocess.Popen, timeout: float = 60) -> dict:
+    """
+    Wait for the first frame of rasp_server
+
+    Returns:
+        cold start: seconds from the launch until the socket answers ("listening") and until the first frame
+    """
+
+    start = time.perf_counter()
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"rasp_server exited ({process.returncode})")
+        try:
+            sc.recv_metrics("127.0.0.1", args.port, merge=False)
+            break
+        except OSError:
+            time.sleep(0.05)
+    else:
+        raise TimeoutError("rasp_server is not ready")
+    listening = time.perf_counter() - start
+    # first frame (camera warm up)
+    if isinstance(sc.recv_sensing("127.0.0.1", args.port, with_readings=False, profile=args.profile)[0], int):
+        raise RuntimeError("no frame from rasp_server")
+    return {"listening": listening, "first_frame": time.perf_counter() - start}
+
+
+def sensing_client(args, op: Op, stop: threading.Event):
+    session = sc.NodeSession("127.0.0.1", args.port) if args.session else None
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            if session is not None:
+                img, readings = session.sensing(not args.no_readings, encoding=args.encoding, profile=args.profile)
+            else:
+                img, readings = sc.recv_sensing(
+                    "127.0.0.1", args.port, not args.no_readings, encoding=args.encoding, profile=args.profile
+                )
+            ok = not isinstance(img, int) and (args.no_readings or readings is not None)
+        except Exception:
+            ok = False
+            if session is not None:
+                session.close()
+        op.record(time.perf_counter() - start, ok)
+    if session is not None:
+        session.close()
+
+
+def control_client(args, op: Op, ack: Op, stop: threading.Event):
+    session = sc.NodeSession("127.0.0.1", args.port)
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            reply = session.control(args.pump, **args.actuators)
+            ok = True
+            ack.record(reply["ack"], True)
+        except Exception:
+            ok = False
+            session.close()
+        op.record(time.perf_counter() - start, ok)
+        stop.wait(args.control_interval)
+    session.close()
+
+
+def unplug_loop(args, arduino: FakeArduino, stop: threading.Event):
+    while not stop.wait(args.unplug_every):
+        arduino.unplug(args.unplug_for)
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Regressions of result against baseline: slower percentiles, lower throughput, more errors, slower start
+    """
+
+    regressions = []
+    for name, base in baseline["ops"].items():
+        current = result["ops"].get(name)
+        if current is None or not base["ok"]:
+            continue
+        for key in ("p50", "p99"):
+            if current[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name} {key}: {current[key] * 1000:.1f} ms > {base[key] * 1000:.1f} ms")
+        if current["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{name} throughput: {current['throughput']:.2f}/s < {base['throughput']:.2f}/s")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name} errors: {current['errors']} > {base['errors']}")
+    for key, base in baseline.get("startup", {}).items():
+        if result["startup"][key] > base * (1 + tolerance):
+            regressions.append(f"startup {key}: {result['startup'][key]:.2f} s > {base:.2f} s")
+    return regressions
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="bench_rasp_server_")
+    arduino = FakeArduino(
+        sensors=args.sensors,
+        latency=args.latency,
+        control_latency=args.control_latency,
+        jitter=args.jitter,
+        corrupt_rate=args.corrupt_rate,
+        serial_timeout=args.serial_timeout,
+    )
+    arduino.start()
+    process = start_pi(args, arduino.port, workdir)
+    try:
+        startup = wait_ready(args, process)
+        ops = {"sensing": Op(), "control": Op(), "control.ack": Op()}
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=sensing_client, args=(args, ops["sensing"], stop)) for _ in range(args.clients)
+        ] + [
+            threading.Thread(target=control_client, args=(args, ops["control"], ops["control.ack"], stop))
+            for _ in range(args.control_clients)
+        ]
+        if args.unplug_every:
+            threads.append(threading.Thread(target=unplug_loop, args=(args, arduino, stop)))
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+
+        result = {
+            "config": {key: value for key, value in vars(args).items() if key not in ("json", "baseline")},
+            "elapsed": elapsed,
+            "startup": startup,
+            "ops": {name: op.result(elapsed) for name, op in ops.items() if op.histogram.count or op.errors},
+            "pi": sc.recv_metrics("127.0.0.1", args.port, merge=False),
+            "status": sc.recv_status("127.0.0.1", args.port),
+            "arduino": {"boots": arduino.boots, "unplugs": arduino.unplugs, "commands": arduino.commands},
+        }
+    finally:
+        process.terminate()
+        process.wait()
+        arduino.stop()
+
+    for name, op in result["ops"].items():
+        print(
+            f"{name}: {op['ok']} ok, {op['errors']} errors, {op['throughput']:.2f}/s, "
+            f"mean={op['mean'] * 1000:.1f} ms, p50={op['p50'] * 1000:.1f} ms, "
+            f"p90={op['p90'] * 1000:.1f} ms, p99={op['p99'] * 1000:.1f} ms"
+        )
+    print(
+        f"startup: listening after {result['startup']['listening']:.2f} s, "
+        f"first frame after {result['startup']['first_frame']:.2f} s"
+    )
+    print("rasp_server:")
+    for line in summary(result["pi"]):
+        print(f"  {line}")
+    print(f"status: {json.dumps(result['status'], indent=1)}")
+    print(f"arduino: {result['arduino']}")
+    print(f"rasp_server log: {os.path.join(workdir, 'rasp_server.log')}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark rasp_server with a simulated camera and Arduino",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("-p", "--port", type=int, default=9990, help="PORT of the benchmarked rasp_server")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent sensing clients")
+    parser.add_argument("--control-clients", type=int, default=0, help="concurrent control clients")
+    parser.add_argument("--control-interval", type=float, default=0.0, help="seconds between control requests")
+    parser.add_argument("--pump", type=int, default=0, help="pump activation time of control requests")
+    parser.add_argument("--actuators", type=json.loads, default={}, help='other actuators, ex. {"fan": 128}')
+    parser.add_argument("--duration", type=float, default=20, help="seconds")
+    parser.add_argument("--session", action="store_true", help="persistent sessions instead of a connection per request")
+    parser.add_argument("--no-readings", action="store_true", help="sensing without the Arduino (images only)")
+    parser.add_argument("--profile", default=None, help="capture profile of sensing requests (ex. preview)")
+    parser.add_argument("--encoding", type=json.loads, default=None, help='ex. {"color": "raw", "depth": "raw"}')
+    parser.add_argument("--persist", action="store_true", help="run rasp_server without -d (frames and records saved)")
+    parser.add_argument("--fps", type=float, default=15, help="frame rate of the simulated camera")
+    parser.add_argument("--motion", type=int, default=1, help="pixels the simulated scene moves per frame")
+    parser.add_argument("--sensors", default="01", help="SDI-12 addresses of the simulated Arduino")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per sensing command of the Arduino")
+    parser.add_argument("--control-latency", type=float, default=0.0, help="seconds per Arduino actuator command")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds per Arduino command")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0, help="probability of 'wrong. retry.'")
+    parser.add_argument("--serial-timeout", type=float, default=1.0, help="Serial.readStringUntil() timeout")
+    parser.add_argument("--unplug-every", type=float, default=0, help="seconds between simulated USB glitches")
+    parser.add_argument("--unplug-for", type=float, default=1.0, help="seconds the Arduino stays unplugged")
+    parser.add_argument("--json", default=None, help="save the results")
+    parser.add_argument("--baseline", default=None, help="results to compare with (see --json)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    sys.exit(main(parser.parse_args()))
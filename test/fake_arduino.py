@@ -0,0 +1,270 @@
+"""
+pty-backed simulation of arduino/main/main.ino for running rasp_server without an Arduino
+
+The slave end of a pseudo terminal stands in for /dev/ttyACM0. Like the board, the fake "resets" whenever
+the port is opened: it prints the boot banner (SDI-12 address scan) and then answers commands.
+A command ends with "\n" or, without one, when Serial.readStringUntil() times out
+(serial_timeout of silence, 1 s on the board):
+    sensing: one takeMeasurement() line per sensor, the A4/A5 analog line and "___"
+    <05.1f,05.1f,03d,03d,03d>: "ack <...>" and "___" (applyActuators), "wrong. retry." if malformed
+    control: nothing
+    anything else: "wrong. retry."
+
+The port is a symlink to the slave end, so unplug() can drop the device and bring it back under the same path,
+like a USB glitch of /dev/ttyACM0.
+
+Example:
+    with FakeArduino(latency=0.2) as arduino:
+        SerialTransport(arduino.port, 115200)
+
+    python fake_arduino.py --latency 0.5  # prints the port, then serves until ctrl + C
+"""
+import argparse
+import os
+import random
+import select
+import shutil
+import tempfile
+import threading
+import time
+import tty
+from typing import List, Optional
+
+LIMITS = [(-10, 50), (0, 100), (0, 300), (0, 255), (0, 255)]  # fields of applyActuators()
+
+
+def format_measurement(address: str, values: List[float], elapsed: Optional[int] = None) -> str:
+    """
+    Line of takeMeasurement() + getResults() + println(" ") in main.ino:
+    the elapsed ms only when the sensor finished early, and ", " only before positive values
+    (the first '+' is dropped, a '-' is printed as part of the value)
+
+    Example:
+        format_measurement("0", [1.23, -4.56, 7.0], 820) -> "0M!, 0, 1, 3, 820, 1.2300000000-4.5600000000, 7.0000000000 "
+    """
+
+    line = f"{address}M!, {address}, 1, {len(values)}, "
+    if elapsed is not None:
+        line += f"{elapsed}, "
+    for i, value in enumerate(values):
+        if i and value >= 0:
+            line += ", "
+        line += f"{value:.10f}"
+    return line + " "
+
+
+class FakeArduino:
+    """
+    Args:
+        sensors: SDI-12 addresses of the simulated sensors
+        latency: seconds per sensing command (SDI-12 measurement time)
+        control_latency: seconds per actuator command
+        jitter: uniform random extra seconds per command
+        corrupt_rate: probability that a command arrives corrupted and is answered with "wrong. retry."
+        boot_delay: seconds between opening the port and the banner (board reset)
+        serial_timeout: Stream timeout of Serial.readStringUntil() in seconds
+        no_sensors: print "No sensors found" and hang like main.ino without sensors
+    """
+
+    def __init__(
+        self,
+        sensors: str = "01",
+        latency: float = 0.0,
+        control_latency: float = 0.0,
+        jitter: float = 0.0,
+        corrupt_rate: float = 0.0,
+        boot_delay: float = 0.1,
+        serial_timeout: float = 1.0,
+        no_sensors: bool = False,
+    ):
+        self.sensors = "" if no_sensors else sensors
+        self.latency = latency
+        self.control_latency = control_latency
+        self.actuators = None  # last applied actuator fields
+        self.jitter = jitter
+        self.corrupt_rate = corrupt_rate
+        self.boot_delay = boot_delay
+        self.serial_timeout = serial_timeout
+        self.commands = {}  # command -> count received
+        self.boots = 0
+        self.unplugs = 0
+        self._unplug = None  # seconds of the pending unplug()
+        self._stop = threading.Event()
+        self._thread = None
+        self._dir = tempfile.mkdtemp(prefix="fake_arduino_")
+        self.port = os.path.join(self._dir, "ttyACM0")
+        self._plug()
+
+    def _plug(self):
+        self.master, slave = os.openpty()
+        tty.setraw(self.master)
+        os.symlink(os.ttyname(slave), self.port + ".new")
+        os.replace(self.port + ".new", self.port)
+        # while nobody holds the slave end, reading the master fails: that is how opening the port is detected
+        os.close(slave)
+
+    def unplug(self, seconds: float):
+        """
+        Drop the device (reads of the open port fail) and plug it back after seconds
+        """
+
+        self._unplug = seconds
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="FakeArduino", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        os.close(self.master)
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _write(self, lines: List[str]):
+        data = "".join(line + "\r\n" for line in lines).encode()
+        while data:
+            try:
+                data = data[os.write(self.master, data):]
+            except OSError:  # port closed meanwhile
+                return
+
+    def _boot(self):
+        self.boots += 1
+        time.sleep(self.boot_delay)
+        lines = [
+            "Opening SDI-12 bus...",
+            "Timeout value: ",
+            "-9999",
+            "Scanning all addresses, please wait...",
+            "Address, Protocol Version, Vendor, Model, Sensor Version, Sensor ID",
+        ]
+        for address in self.sensors:
+            lines.append(f"{address}, 1.3, METER   , TER12 , 100, fake{address}, ")
+        lines.append(f"Total number of sensors found:  {len(self.sensors)}")
+        if not self.sensors:
+            lines.append("No sensors found, please check connections and restart the Arduino.")
+        self._write(lines)
+
+    def _sensing(self) -> List[str]:
+        lines = []
+        for address in self.sensors:
+            values = [random.uniform(1800, 2500), random.uniform(-5, 30), random.choice([0.0, -9999.0])]
+            elapsed = random.randint(500, 900) if random.random() < 0.5 else None  # finished early
+            lines.append(format_measurement(address, values, elapsed))
+        lines.append(f"{random.uniform(0, 1000):.2f}W*m-2")
+        lines.append("___")
+        return lines
+
+    def _actuate(self, command: str) -> List[str]:
+        fields = command[1:-1].split(",") if command.endswith(">") else []
+        try:
+            values = [float(field) for field in fields]
+        except ValueError:
+            values = []
+        if len(values) != len(LIMITS) or any(not low <= v <= high for v, (low, high) in zip(values, LIMITS)):
+            return ["wrong. retry."]
+        time.sleep(self.control_latency + random.uniform(0, self.jitter))
+        self.actuators = values
+        return [f"ack {command}", "___"]
+
+    def respond(self, command: str) -> List[str]:
+        """
+        Response lines of loop() to one command
+        """
+
+        self.commands[command] = self.commands.get(command, 0) + 1
+        if self.corrupt_rate and random.random() < self.corrupt_rate:
+            return ["wrong. retry."]
+        if command == "sensing":
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+            return self._sensing()
+        if command.startswith("<"):
+            return self._actuate(command)
+        if command == "control":
+            return []
+        return ["wrong. retry."]
+
+    def _command(self, line: bytes):
+        if self.sensors:  # main.ino never reaches loop() without sensors
+            self._write(self.respond(line.decode(errors="replace").strip("\r")))
+
+    def _run(self):
+        connected = False
+        buffer = b""
+        last_data = 0
+        while not self._stop.is_set():
+            if self._unplug is not None:
+                seconds, self._unplug = self._unplug, None
+                self.unplugs += 1
+                os.remove(self.port)
+                os.close(self.master)
+                self._stop.wait(seconds)
+                self._plug()
+                connected = False
+                buffer = b""
+                continue
+            wait = 0.1
+            if buffer:
+                wait = max(0, min(wait, last_data + self.serial_timeout - time.time()))
+            readable, _, _ = select.select([self.master], [], [], wait)
+            if not readable:
+                if not connected:  # the slave end is open and quiet: the port was opened
+                    connected = True
+                    buffer = b""
+                    self._boot()
+                elif buffer and time.time() - last_data >= self.serial_timeout:
+                    line, buffer = buffer, b""
+                    self._command(line)
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:  # nobody holds the port
+                connected = False
+                time.sleep(0.05)
+                continue
+            if not connected:
+                connected = True
+                self._boot()
+            buffer += data
+            last_data = time.time()
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                self._command(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Simulated Arduino (main.ino) on a pseudo terminal",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--sensors", default="01", help="SDI-12 addresses")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per sensing command")
+    parser.add_argument("--control-latency", type=float, default=0.0, help="seconds per actuator command")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds per command")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0, help="probability of 'wrong. retry.'")
+    parser.add_argument("--serial-timeout", type=float, default=1.0, help="end of a command without newline")
+    args = parser.parse_args()
+
+    arduino = FakeArduino(
+        args.sensors,
+        args.latency,
+        args.control_latency,
+        args.jitter,
+        args.corrupt_rate,
+        serial_timeout=args.serial_timeout,
+    )
+    print(arduino.port, flush=True)
+    arduino.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        arduino.stop()
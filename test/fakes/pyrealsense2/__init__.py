@@ -0,0 +1,2 @@
+# Simulated pyrealsense2 for running rasp_server without a camera (see pyrealsense2.py)
+from .pyrealsense2 import *
@@ -0,0 +1,244 @@
+"""
+Simulated subset of pyrealsense2 used by raspberry_pi/get_rgbd_img.py
+
+Put test/fakes first on PYTHONPATH so that `import pyrealsense2.pyrealsense2 as rs` loads this module.
+The pipeline produces synthetic frames (a textured bed with "plants" drifting sideways) paced at the
+requested frame rate. Environment variables:
+    FAKE_REALSENSE_FPS: frame rate (default: the rate of config.enable_stream)
+    FAKE_REALSENSE_PRODUCT_LINE: "D400" (default) or "L500" (960x540 color, like the L515)
+    FAKE_REALSENSE_MOTION: pixels the scene moves per frame (default: 1, 0: static scene)
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+
+class camera_info:
+    name = "name"
+    product_line = "product_line"
+    serial_number = "serial_number"
+
+
+class stream:
+    depth = "depth"
+    color = "color"
+
+
+class format:
+    z16 = "z16"
+    bgr8 = "bgr8"
+    rgb8 = "rgb8"
+
+
+class option:
+    filter_magnitude = "filter_magnitude"
+    filter_smooth_alpha = "filter_smooth_alpha"
+    filter_smooth_delta = "filter_smooth_delta"
+    holes_fill = "holes_fill"
+
+
+class sensor:
+    def __init__(self, name: str):
+        self._name = name
+
+    def get_info(self, info):
+        return self._name if info == camera_info.name else ""
+
+
+class device:
+    def __init__(self, product_line: str):
+        self._product_line = product_line
+        self.sensors = [sensor("Stereo Module"), sensor("RGB Camera")]
+
+    def get_info(self, info):
+        if info == camera_info.product_line:
+            return self._product_line
+        if info == camera_info.serial_number:
+            return "000000000000"
+        return "Intel RealSense (simulated)"
+
+
+class pipeline_profile:
+    def __init__(self, dev: device):
+        self._device = dev
+
+    def get_device(self) -> device:
+        return self._device
+
+
+class pipeline_wrapper:
+    def __init__(self, pipe):
+        self.pipeline = pipe
+
+
+class config:
+    def __init__(self):
+        self.streams = {}
+
+    def enable_stream(self, stream_type, width, height, fmt, fps):
+        self.streams[stream_type] = (width, height, fmt, fps)
+
+    def resolve(self, wrapper) -> pipeline_profile:
+        return pipeline_profile(device(os.environ.get("FAKE_REALSENSE_PRODUCT_LINE", "D400")))
+
+
+class frame:
+    def __init__(self, data: np.ndarray, frame_number: int, timestamp: float):
+        self._data = data
+        self.frame_number = frame_number
+        self.timestamp = timestamp
+
+    def __bool__(self):
+        return self._data is not None
+
+    def get_data(self) -> np.ndarray:
+        return self._data
+
+    def get_frame_number(self) -> int:
+        return self.frame_number
+
+    def get_timestamp(self) -> float:
+        return self.timestamp * 1000
+
+    def get_width(self) -> int:
+        return self._data.shape[1]
+
+    def get_height(self) -> int:
+        return self._data.shape[0]
+
+
+class composite_frame(frame):
+    def __init__(self, depth: frame, color: frame):
+        super().__init__(depth.get_data(), depth.frame_number, depth.timestamp)
+        self._depth = depth
+        self._color = color
+
+    def get_depth_frame(self) -> frame:
+        return self._depth
+
+    def get_color_frame(self) -> frame:
+        return self._color
+
+    def as_frameset(self) -> "composite_frame":
+        return self
+
+
+def _scene(width: int, height: int):
+    """
+    Static scene of the simulated camera: bed texture with green blobs, depth 1 m below the camera
+    and blobs up to 25 cm higher
+    """
+
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    color = np.empty((height, width, 3), np.float32)
+    color[..., 0] = 60 + 20 * np.sin(x / 17)
+    color[..., 1] = 80 + 20 * np.cos(y / 23)
+    color[..., 2] = 110 + 10 * np.sin((x + y) / 31)
+    depth = np.full((height, width), 1000.0, np.float32)
+    for cx, cy, r in zip(rng.uniform(0, width, 12), rng.uniform(0, height, 12), rng.uniform(20, 60, 12)):
+        blob = np.clip(1 - ((x - cx) ** 2 + (y - cy) ** 2) / r ** 2, 0, 1)
+        color += blob[..., None] * np.array([-40, 120, -60], np.float32)
+        depth -= 250 * blob
+    color += rng.normal(0, 4, color.shape)
+    return np.clip(color, 0, 255).astype(np.uint8), depth.astype(np.uint16)
+
+
+class pipeline:
+    def __init__(self):
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self, cfg: config = None) -> pipeline_profile:
+        cfg = cfg or config()
+        color_width, color_height, _, fps = cfg.streams.get(stream.color, (640, 480, format.bgr8, 30))
+        depth_width, depth_height, _, _ = cfg.streams.get(stream.depth, (640, 480, format.z16, fps))
+        self.fps = float(os.environ.get("FAKE_REALSENSE_FPS", fps))
+        self.motion = int(os.environ.get("FAKE_REALSENSE_MOTION", 1))
+        self._color, _ = _scene(color_width, color_height)
+        _, self._depth = _scene(depth_width, depth_height)
+        self._frame_number = 0
+        self._start_time = time.time()
+        self._started = True
+        return cfg.resolve(pipeline_wrapper(self))
+
+    def stop(self):
+        if not self._started:
+            raise RuntimeError("stop() cannot be called before start()")
+        self._started = False
+
+    def wait_for_frames(self, timeout_ms: int = 5000) -> composite_frame:
+        with self._lock:
+            if not self._started:
+                raise RuntimeError("wait_for_frames cannot be called before start()")
+            # next frame on the sensor clock; frames are dropped when the caller is too slow, like the camera
+            due = int((time.time() - self._start_time) * self.fps) + 1
+            due = max(due, self._frame_number + 1)
+            delay = self._start_time + due / self.fps - time.time()
+            if delay > timeout_ms / 1000:
+                time.sleep(timeout_ms / 1000)
+                raise RuntimeError(f"Frame didn't arrive within {timeout_ms}")
+            if delay > 0:
+                time.sleep(delay)
+            self._frame_number = due
+            shift = due * self.motion
+            timestamp = time.time()
+            return composite_frame(
+                frame(np.roll(self._depth, shift, axis=1), due, timestamp),
+                frame(np.roll(self._color, shift, axis=1), due, timestamp),
+            )
+
+
+class _filter:
+    def __init__(self, *args):
+        self.options = {}
+
+    def set_option(self, opt, value):
+        self.options[opt] = value
+
+    def process(self, frames):
+        return frames
+
+
+class decimation_filter(_filter):
+    def process(self, frames):
+        step = int(self.options.get(option.filter_magnitude, 2))
+        depth = frames.get_depth_frame()
+        decimated = frame(np.ascontiguousarray(depth.get_data()[::step, ::step]), depth.frame_number, depth.timestamp)
+        return composite_frame(decimated, frames.get_color_frame())
+
+
+class disparity_transform(_filter):
+    pass
+
+
+class spatial_filter(_filter):
+    pass
+
+
+class temporal_filter(_filter):
+    pass
+
+
+class hole_filling_filter(_filter):
+    pass
+
+
+class align(_filter):
+    def __init__(self, align_to):
+        super().__init__()
+        self.align_to = align_to
+
+    def process(self, frames):
+        depth = frames.get_depth_frame()
+        color = frames.get_color_frame()
+        if self.align_to != stream.color or depth.get_data().shape[:2] == color.get_data().shape[:2]:
+            return frames
+        # nearest neighbour resampling of depth to the color resolution
+        height, width = color.get_data().shape[:2]
+        data = depth.get_data()
+        rows = np.arange(height) * data.shape[0] // height
+        cols = np.arange(width) * data.shape[1] // width
+        return composite_frame(frame(data[rows][:, cols], depth.frame_number, depth.timestamp), color)
@@ -0,0 +1,79 @@
+"""
+Actuator commands of raspberry_pi/actuation.py (validation, coalescing, duplicates, fixed width format)
+
+    python -m pytest test
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "raspberry_pi")]
+
+import actuation  # noqa: E402
+
+
+def test_pump_activation_survives_a_later_off():
+    merged = actuation.merge({"pump": 30, "fan": 100}, {"pump": 0, "fan": 200})
+    assert merged == {"pump": 30, "fan": 200}
+    assert actuation.merge({"pump": 30}, {"pump": 10}) == {"pump": 10}  # a later activation replaces it
+
+
+def test_duplicate_setpoints_not_needed():
+    state = actuation.initial_state()
+    values, needed = actuation.apply(state, {"fan": 128, "temperature": 25.0})
+    assert needed
+    state = values
+    values, needed = actuation.apply(state, {"fan": 128})
+    assert not needed
+    assert values == state
+    values, needed = actuation.apply(state, {"pump": 5})  # momentary: acts on every command
+    assert needed
+    assert values["pump"] == 5 and values["fan"] == 128
+
+
+def test_format_parse_round_trip():
+    values = {"temperature": -10.0, "humidity": 66.5, "pump": 255, "fan": 150, "led": 7}
+    command = actuation.format_command(values)
+    assert command == "<-10.0,066.5,255,150,007>"
+    assert actuation.parse_command(command) == values
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        "-10.0,066.5,255,150,128",  # not enclosed
+        "<-10.0,066.5,255,150>",  # missing field
+        "<-10.0,66.5,255,150,128>",  # not zero padded
+        "<-10.0,066.5,255,150,1280>",  # too wide
+        "<-10.0,066.5,301,150,128>",  # pump out of range
+    ],
+)
+def test_parse_rejects(command):
+    with pytest.raises(ValueError):
+        actuation.parse_command(command)
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {"pump": 301},
+        {"fan": -1},
+        {"temperature": 50.1},
+        {"pump": True},
+        {"fan": "128"},
+        {"fan": 1.5},
+        {"humidity": float("nan")},
+        {"pump": float("nan")},
+        {"pump": float("inf")},
+        {"heater": 1},
+    ],
+)
+def test_validate_rejects(changes):
+    with pytest.raises(ValueError):
+        actuation.validate(changes)
+
+
+def test_validate_normalizes():
+    assert actuation.validate({"fan": 128.0, "temperature": 21.26}) == {"fan": 128, "temperature": 21.3}
@@ -0,0 +1,66 @@
+"""
+Order, lookup and segment boundaries of raspberry_pi/frame_archive.py
+
+    python -m pytest test
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "raspberry_pi")]
+
+from frame_archive import FrameArchive  # noqa: E402
+
+SHAPE = (2, 3)
+
+
+def frame(i):
+    color = np.full(SHAPE + (3,), i, dtype=np.uint8)
+    depth = np.full(SHAPE, 1000 + i, dtype=np.uint16)
+    return color, depth
+
+
+def filled(root, count=5):
+    archive = FrameArchive(root, SHAPE, segment_frames=2)
+    for i in range(count):
+        assert archive.append(100.0 + i, *frame(i)) == i
+    return archive
+
+
+def test_append_order(tmp_path):
+    archive = filled(str(tmp_path))
+    for timestamp in (104.0, 103.5):  # not after the last frame
+        with pytest.raises(ValueError):
+            archive.append(timestamp, *frame(9))
+    assert len(archive) == 5
+    assert archive.last_timestamp == 104.0
+
+
+def test_lookup(tmp_path):
+    archive = filled(str(tmp_path))
+    assert archive.lookup(100.0) == 0
+    assert archive.lookup(103.0) == 3
+    assert archive.lookup(103.5) is None
+    assert archive.lookup(200.0) is None
+
+
+def test_frames_across_segments(tmp_path):
+    archive = filled(str(tmp_path))
+    timestamps, color, depth = archive.frames(1, 4)  # segments 0, 1
+    assert list(timestamps) == [101.0, 102.0, 103.0]
+    assert [int(c[0, 0, 0]) for c in color] == [1, 2, 3]
+    assert [int(d[0, 0]) for d in depth] == [1001, 1002, 1003]
+    assert archive.frames(2, 4)[1].shape == (2,) + SHAPE + (3,)  # one segment
+    assert len(archive.frames(5)[0]) == 0
+
+
+def test_reopen(tmp_path):
+    filled(str(tmp_path))
+    archive = FrameArchive(str(tmp_path), SHAPE, segment_frames=2)
+    assert len(archive) == 5
+    archive.append(105.0, *frame(5))
+    _, color, _ = archive.frames(4, 6)
+    assert [int(c[0, 0, 0]) for c in color] == [4, 5]
@@ -0,0 +1,41 @@
+"""
+Counters and histograms of metrics.py (server/ copy; raspberry_pi/ holds the same file)
+
+    python -m pytest test
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "server")]
+
+from metrics import Metrics  # noqa: E402
+
+
+def node_snapshot(requests, latencies):
+    node = Metrics()
+    node.count("requests.sensing", requests)
+    for seconds in latencies:
+        node.observe("request.sensing", seconds)
+    return node.snapshot()
+
+
+def test_merge_snapshot_adds():
+    registry = Metrics()
+    registry.merge_snapshot(node_snapshot(2, [0.1]), "a/")
+    registry.merge_snapshot(node_snapshot(3, [0.2]), "b/")
+    registry.merge_snapshot(node_snapshot(1, [0.3]), "a/")
+    assert registry.counters == {"a/requests.sensing": 3, "b/requests.sensing": 3}
+    assert registry.histograms["a/request.sensing"].count == 2
+
+
+def test_replace_snapshot_keeps_the_latest_pull():
+    registry = Metrics()
+    registry.count("local")
+    registry.replace_snapshot(node_snapshot(5, [0.1]), "pi/")
+    registry.replace_snapshot(node_snapshot(5, [0.1]), "pi/")
+    registry.replace_snapshot(node_snapshot(7, [0.1, 2.0]), "pi/")
+    assert registry.counters == {"local": 1, "pi/requests.sensing": 7}
+    histogram = registry.histograms["pi/request.sensing"]
+    assert histogram.count == 2
+    assert histogram.max == 2.0
@@ -0,0 +1,47 @@
+"""
+Parsing of the sensing response of main.ino (raspberry_pi/observation.py)
+
+    python -m pytest test
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "raspberry_pi"), os.path.dirname(os.path.abspath(__file__))]
+
+from fake_arduino import format_measurement  # noqa: E402
+from observation import ANALOG_ADDRESS, parse_sdi12_line, parse_sensing  # noqa: E402
+
+
+def test_negative_values_without_separator():
+    reading = parse_sdi12_line("0M!, 0, 1, 3, 820, 1.2300000000-4.5600000000, 7.0000000000 ", 1.0)
+    assert reading.address == "0"
+    assert reading.values == [1.23, -4.56, 7.0]
+
+
+def test_elapsed_is_not_a_value():
+    # fewer results than announced: the elapsed ms must not shift into the values
+    reading = parse_sdi12_line("0M!, 0, 1, 3, 820, 1.2300000000, 2.0000000000, ", 1.0)
+    assert reading.values == [1.23, 2.0, None]
+
+
+def test_without_elapsed():
+    reading = parse_sdi12_line("1M!, 1, 1, 2, -0.5000000000-9999.0000000000 ", 1.0)
+    assert reading.values == [-0.5, None]
+
+
+def test_fake_arduino_format():
+    values = [2012.5, -3.25, 0.0]
+    for elapsed in (None, 640):
+        reading = parse_sdi12_line(format_measurement("a", values, elapsed), 1.0)
+        assert reading.address == "a"
+        assert reading.values == values
+
+
+def test_parse_sensing():
+    lines = ["0M!, 0, 1, 3, 1.0000000000-2.0000000000, 3.0000000000 ", "512.50W*m-2"]
+    readings = parse_sensing(lines, 5.0)
+    assert [reading.address for reading in readings] == ["0", ANALOG_ADDRESS]
+    assert readings[0].values == [1.0, -2.0, 3.0]
+    assert readings[1].values == [512.5]
+    assert all(reading.timestamp == 5.0 for reading in readings)
@@ -0,0 +1,58 @@
+"""
+Keys and cursors of raspberry_pi/record_store.py (samples and sync rely on them)
+
+    python -m pytest test
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "raspberry_pi")]
+
+from record_store import RecordStore, time_to_key  # noqa: E402
+
+DAY = 86400
+T0 = 1700000000.0  # 2023-11-15 07:13:20 KST
+
+
+def test_keys_strictly_increasing_across_restarts(tmp_path):
+    store = RecordStore(str(tmp_path))
+    first = store.append("obs", {"i": 0}, timestamp=T0)
+    second = store.append("obs", {"i": 1}, timestamp=T0)  # same clock tick
+    store.close()
+    store = RecordStore(str(tmp_path))
+    third = store.append("obs", {"i": 2}, timestamp=T0 - 10)  # clock set back
+    assert first == time_to_key(T0)
+    assert first < second < third
+    assert [record["i"] for record in store.since("obs")] == [0, 1, 2]
+
+
+def test_since_across_days_and_segments(tmp_path):
+    store = RecordStore(str(tmp_path), segment_records=2)
+    keys = [store.append("obs", {"i": i}, timestamp=T0 + i * 60) for i in range(5)]
+    keys += [store.append("obs", {"i": i}, timestamp=T0 + DAY + i * 60) for i in range(5, 8)]
+    assert len(os.listdir(os.path.join(str(tmp_path), "obs"))) == 2  # days
+    assert [record["key"] for record in store.since("obs")] == keys
+    assert [record["key"] for record in store.since("obs", keys[2])] == keys[3:]
+    assert [record["key"] for record in store.since("obs", keys[4])] == keys[5:]  # first record of the next day
+    assert [record["key"] for record in store.since("obs", keys[1], limit=3)] == keys[2:5]
+    assert list(store.since("obs", keys[-1])) == []
+
+
+def test_query_bounds(tmp_path):
+    store = RecordStore(str(tmp_path))
+    for i in range(5):
+        store.append("act", {"i": i}, timestamp=T0 + i)
+    assert [record["i"] for record in store.query("act", T0 + 1, T0 + 3)] == [1, 2]  # start <= time < end
+    assert [record["i"] for record in store.query("act", end=T0 + 1)] == [0]
+    assert [record["i"] for record in store.query("act", start=T0 + 4)] == [4]
+
+
+def test_latest(tmp_path):
+    store = RecordStore(str(tmp_path), segment_records=2)
+    assert store.latest("sample") is None
+    for i in range(3):
+        store.append("sample", {"i": i}, timestamp=T0 + i * DAY)
+    assert store.latest("sample")["i"] == 2
+    store.close()
+    assert RecordStore(str(tmp_path)).latest("sample")["i"] == 2
@@ -0,0 +1,18 @@
+"""
+Modules copied into both raspberry_pi/ and server/ (each side is deployed alone) must stay identical
+
+    python -m pytest test
+"""
+import filecmp
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED = ("wire.py", "metrics.py", "log_utils.py")
+
+
+@pytest.mark.parametrize("name", SHARED)
+def test_copies_identical(name):
+    pi, server = os.path.join(ROOT, "raspberry_pi", name), os.path.join(ROOT, "server", name)
+    assert filecmp.cmp(pi, server, shallow=False), f"raspberry_pi/{name} and server/{name} differ"